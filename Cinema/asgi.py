@@ -2,10 +2,18 @@ import os
 
 from channels.routing import ProtocolTypeRouter, URLRouter
 from django.core.asgi import get_asgi_application
+from django.urls import path, re_path
 
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'Cinema.settings')
 
+django_application = get_asgi_application()
+
+from cinapp.API.async_resources import availability_stream  # noqa: E402 - needs the app registry
+
 application = ProtocolTypeRouter({
-    "http": get_asgi_application(),
+    "http": URLRouter([
+        path('api/session/<int:pk>/availability/stream', availability_stream),
+        re_path(r'', django_application),
+    ]),
 })
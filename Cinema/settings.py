@@ -37,6 +37,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'cinapp',
     'rest_framework',
     'rest_framework.authtoken',
@@ -141,6 +142,60 @@ REST_FRAMEWORK = {
 
 TOKEN_TIME_TO_LIVE = 600
 
+# last_action is only written when it is older than this many seconds, so an idle
+# token may expire up to this much earlier than TOKEN_TIME_TO_LIVE after its last use.
+TOKEN_TOUCH_GRANULARITY = 30
+
+# Users are logged out after SESSION_IDLE_TIMEOUT seconds without requests. The stored
+# timestamp is only rewritten once this fraction of the window has passed, so the
+# session is saved a few times per window instead of on every request.
+SESSION_IDLE_TIMEOUT = 60
+
+SESSION_TOUCH_FRACTION = 0.25
+
+# Reads come from the cache; 'django.contrib.sessions.backends.signed_cookies' avoids server-side I/O entirely.
+SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
+
+# For a shared cache across workers switch to
+# {'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': 'redis://127.0.0.1:6379'}
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+
+SESSION_LIST_CACHE = 'default'
+
+SESSION_LIST_CACHE_TIMEOUT = 300
+
+# 'local' keeps authenticated tokens in a per-process LRU; a CACHES alias shares them between workers.
+# Entries hold the user id and last activity only, the user itself is read on every request. A token
+# deleted through another worker still authenticates in this one for up to TOKEN_CACHE_TIMEOUT seconds
+# with 'local' or a per-process alias such as the default locmem one.
+TOKEN_CACHE = 'local'
+
+TOKEN_CACHE_SIZE = 10000
+
+TOKEN_CACHE_TIMEOUT = 60
+
+# Seconds a checkout keeps its seats before the sweep_holds command gives them back.
+SEAT_HOLD_TTL = 600
+
+# Seconds a response is replayed to retries with the same Idempotency-Key.
+IDEMPOTENCY_KEY_TTL = 24 * 60 * 60
+
+# Seat availability events reach stream watchers of the same process with 'local';
+# 'postgres' relays them through LISTEN/NOTIFY to every worker process.
+AVAILABILITY_BROKER = 'local'
+
+# Deleted sessions are moved with their purchases to the archive tables instead of cascading away.
+# Purchase exports, analytics, rollups and user counters read the archive next to the live tables.
+ARCHIVE_DELETED_SESSIONS = True
+
+# Days after their end that the archive_sessions command moves sessions and their purchases to the
+# archive tables.
+ARCHIVE_AFTER_DAYS = 400
+
 SECRET_KEY = 'django-insecure-g$^nm)3*@x@4+1(nic5ki+-pqsu5+m+s445$9acss_*ykjs+cw'
 
 # ASGI_APPLICATION = 'Cinema.asgi.application'
\ No newline at end of file
@@ -2,7 +2,9 @@ from django.contrib import admin
 from django.urls import path, include
 from rest_framework.routers import SimpleRouter
 from cinapp.API.resources import CustomAuthToken, FilmModelViewSet, HallModelViewSet, FilmSessionModelViewSet, \
-    PurchaseModelViewSet, ApiRegistration
+    PurchaseModelViewSet, ApiRegistration, CacheStatsView, PurchaseExportView, \
+    BoxOfficeView, AnalyticsView, SeatHoldViewSet, ArchivedFilmSessionViewSet, ArchivedPurchaseViewSet
+from cinapp.API import async_resources
 from cinapp.views import FilmSessionListView, Login, Logout, Registration, FilmListView, FilmCreateView, HallListView, \
     HallCreateView, FilmSessionCreateView, FilmSessionDetailView, PurchaseListView, HallUpdateView, \
     FilmSessionUpdateView
@@ -13,6 +15,9 @@ router.register('film', FilmModelViewSet)
 router.register('hall', HallModelViewSet)
 router.register('session', FilmSessionModelViewSet)
 router.register('purchase', PurchaseModelViewSet)
+router.register('hold', SeatHoldViewSet)
+router.register('archive/session', ArchivedFilmSessionViewSet)
+router.register('archive/purchase', ArchivedPurchaseViewSet)
 
 urlpatterns = [
     path('admin/', admin.site.urls),
@@ -30,6 +35,12 @@ urlpatterns = [
     path('hall/update/<int:pk>/', HallUpdateView.as_view(), name='update-hall'),
     path('session/update/<int:pk>/', FilmSessionUpdateView.as_view(), name='update-session'),
     path('api-token-auth/', CustomAuthToken.as_view()),
+    path('api/cache-stats/', CacheStatsView.as_view()),
+    path('api/purchase-export/', PurchaseExportView.as_view()),
+    path('api/reports/', BoxOfficeView.as_view()),
+    path('api/analytics/', AnalyticsView.as_view()),
+    path('api/async/purchase/', async_resources.purchase),
+    path('api/async/session/<int:pk>/availability/', async_resources.availability),
     path('api/', include(router.urls)),
     path('api-registration/', ApiRegistration.as_view()),
 
@@ -0,0 +1,141 @@
+import asyncio
+import json
+
+from asgiref.sync import sync_to_async
+from django.db import close_old_connections
+from django.http import JsonResponse
+from rest_framework import exceptions, serializers, status
+from cinapp.availability import broker
+from cinapp.API.authentications import TokenDeadAuthentication
+from cinapp.API.serializers import PurchasePostSerializer
+from cinapp.models import FilmSession
+from cinapp.reservations import reserve_seats
+from cinapp.seatmap import SeatMap
+
+HEARTBEAT = 15
+
+
+def in_worker_thread(func):
+    # Runs the blocking part of a request in the executor instead of the single
+    # thread_sensitive thread, so purchases waiting on the database do not queue
+    # behind each other or block the event loop. Connections are per thread and
+    # are recycled the same way Django does it around a sync request.
+    def run(*args):
+        close_old_connections()
+        try:
+            return func(*args)
+        finally:
+            close_old_connections()
+    return sync_to_async(run, thread_sensitive=False)
+
+
+def authenticate(request):
+    try:
+        credentials = TokenDeadAuthentication().authenticate(request)
+    except exceptions.AuthenticationFailed as e:
+        return JsonResponse({'detail': e.detail}, status=status.HTTP_401_UNAUTHORIZED)
+    if credentials is None:
+        return JsonResponse({'detail': 'Authentication credentials were not provided.'},
+                            status=status.HTTP_401_UNAUTHORIZED)
+    request.user = credentials[0]
+
+
+@in_worker_thread
+def create_purchase(request, data):
+    denied = authenticate(request)
+    if denied:
+        return denied
+    serializer = PurchasePostSerializer(data=data, context={'request': request})
+    if not serializer.is_valid():
+        return JsonResponse(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        serializer.instance = reserve_seats(request.user, serializer.validated_data['film_session'],
+                                            serializer.validated_data['count'])
+    except serializers.ValidationError as e:
+        return JsonResponse({'non_field_errors': e.detail}, status=status.HTTP_400_BAD_REQUEST)
+    return JsonResponse(serializer.data, status=status.HTTP_201_CREATED)
+
+
+@in_worker_thread
+def session_availability(pk):
+    film_session = FilmSession.objects.select_related('hall').filter(pk=pk).first()
+    if film_session is None:
+        return JsonResponse({'detail': 'Not found.'}, status=status.HTTP_404_NOT_FOUND)
+    seat_map = SeatMap.for_session(film_session)
+    return JsonResponse({'rows': seat_map.rows, 'row_size': seat_map.row_size, 'free': seat_map.free_count,
+                         'layout': seat_map.layout()})
+
+
+@in_worker_thread
+def remaining_seats(pk):
+    return FilmSession.objects.filter(pk=pk).values_list('hall_size', flat=True).first()
+
+
+def not_allowed(request, method):
+    return JsonResponse({'detail': 'Method "%s" not allowed.' % request.method},
+                        status=status.HTTP_405_METHOD_NOT_ALLOWED, headers={'Allow': method})
+
+
+# Django 4.0 view decorators are sync-only and would hide the coroutine, so methods
+# are checked inline and csrf_exempt is set by hand.
+async def purchase(request):
+    if request.method != 'POST':
+        return not_allowed(request, 'POST')
+    try:
+        data = json.loads(request.body)
+    except ValueError:
+        return JsonResponse({'detail': 'JSON parse error.'}, status=status.HTTP_400_BAD_REQUEST)
+    return await create_purchase(request, data)
+
+
+purchase.csrf_exempt = True
+
+
+async def availability(request, pk):
+    if request.method != 'GET':
+        return not_allowed(request, 'GET')
+    return await session_availability(pk)
+
+
+def server_sent_event(data):
+    return {'type': 'http.response.body', 'body': b'data: %s\n\n' % json.dumps(data).encode(), 'more_body': True}
+
+
+async def availability_stream(scope, receive, send):
+    # A raw ASGI app: Django 4.0 would iterate a streaming response inside the event loop.
+    # Watchers read the session once when they connect; every later change is pushed by
+    # the broker, so their number does not add database load.
+    if scope['method'] != 'GET':
+        await send({'type': 'http.response.start', 'status': status.HTTP_405_METHOD_NOT_ALLOWED,
+                    'headers': [(b'allow', b'GET')]})
+        await send({'type': 'http.response.body', 'body': b''})
+        return
+    message = await receive()
+    while message.get('more_body'):
+        message = await receive()
+    pk = scope['url_route']['kwargs']['pk']
+    with broker.subscribe(pk) as events:
+        hall_size = await remaining_seats(pk)
+        if hall_size is None:
+            await send({'type': 'http.response.start', 'status': status.HTTP_404_NOT_FOUND, 'headers': []})
+            await send({'type': 'http.response.body', 'body': b''})
+            return
+        await send({'type': 'http.response.start', 'status': status.HTTP_200_OK, 'headers': [
+            (b'content-type', b'text/event-stream'), (b'cache-control', b'no-cache'), (b'x-accel-buffering', b'no')]})
+        await send(server_sent_event({'hall_size': hall_size}))
+        disconnected = asyncio.ensure_future(receive())
+        try:
+            while True:
+                event = asyncio.ensure_future(events.get())
+                done, pending = await asyncio.wait({event, disconnected}, timeout=HEARTBEAT,
+                                                   return_when=asyncio.FIRST_COMPLETED)
+                if disconnected in done:
+                    event.cancel()
+                    return
+                if event in done:
+                    await send(server_sent_event(event.result()))
+                else:
+                    event.cancel()
+                    await send({'type': 'http.response.body', 'body': b': ping\n\n', 'more_body': True})
+        finally:
+            disconnected.cancel()
@@ -2,27 +2,59 @@ import datetime
 from rest_framework.authentication import TokenAuthentication
 from django.utils import timezone
 from django.conf import settings
+from django.contrib.auth import get_user_model
 from rest_framework import exceptions
+from cinapp.caching import make_cache
+
+token_cache = make_cache('token', settings.TOKEN_CACHE, settings.TOKEN_CACHE_SIZE, settings.TOKEN_CACHE_TIMEOUT)
 
 
 class TokenDeadAuthentication(TokenAuthentication):
+    cache_hit = False
+
     def get_model(self):
         if self.model is not None:
             return self.model
         from cinapp.models import CustomToken
         return CustomToken
 
+    def authenticate_credentials(self, key):
+        # Only the user id and the last activity are cached. The user is read by primary key on
+        # every request, so a deactivation made through another worker applies at once and no
+        # two requests share one user instance.
+        cached = token_cache.get(key)
+        self.cache_hit = cached is not None
+        if cached is None:
+            user, token = super(TokenDeadAuthentication, self).authenticate_credentials(key)
+            token_cache.set(key, (user.pk, token.last_action))
+            return user, token
+        user_id, last_action = cached
+        user = get_user_model()._default_manager.filter(pk=user_id).first()
+        if user is None or not user.is_active:
+            token_cache.delete(key)
+            raise exceptions.AuthenticationFailed('User inactive or deleted.')
+        return user, self.get_model()(pk=key, key=key, user=user, last_action=last_action)
+
     def authenticate(self, request):
         try:
             user, token = super(TokenDeadAuthentication, self).authenticate(request)
         except TypeError:
             return None
+        now = datetime.datetime.now(timezone.utc)
+        delta = (now - token.last_action).total_seconds()
+        if self.cache_hit and delta >= settings.TOKEN_TOUCH_GRANULARITY:
+            # Another worker may have touched the token since it was cached here.
+            token_cache.delete(token.key)
+            user, token = self.authenticate_credentials(token.key)
+            delta = (now - token.last_action).total_seconds()
         if not user.is_superuser:
-            delta = (datetime.datetime.now(timezone.utc) - token.last_action).seconds
             if delta > settings.TOKEN_TIME_TO_LIVE:
                 token.delete()
                 msg = 'Invalid token. Time for token is over.'
                 raise exceptions.AuthenticationFailed(msg)
-        token.last_action = datetime.datetime.now(timezone.utc)
-        token.save()
+        if delta >= settings.TOKEN_TOUCH_GRANULARITY:
+            # Only the timestamp column, and only once per granularity window.
+            self.get_model().objects.filter(pk=token.pk).update(last_action=now)
+            token.last_action = now
+            token_cache.set(token.key, (user.pk, now))
         return user, token
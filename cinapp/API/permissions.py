@@ -13,3 +13,8 @@ class IsAdminOrReadOnly(permissions.BasePermission):
             return True
 
         return request.user.is_superuser
+
+
+class IsSuperUser(permissions.BasePermission):
+    def has_permission(self, request, view):
+        return bool(request.user and request.user.is_superuser)
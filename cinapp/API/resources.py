@@ -1,16 +1,33 @@
+import csv
 import datetime
-from cinapp.API.permissions import IsAdminOrReadOnly
-from django.db import transaction
+import io
+from cinapp.API.permissions import IsAdminOrReadOnly, IsSuperUser
 from rest_framework.authtoken.views import ObtainAuthToken
 from cinapp.API.serializers import FilmSerializer, HallSerializer, FilmSessionGetSerializer, \
-    FilmSessionPostPutPatchSerializer, PurchaseGetSerializer, PurchasePostSerializer, MyUserPostSerializer
-from cinapp.models import CustomToken, Film, Hall, FilmSession, Purchase
-from rest_framework import mixins
+    FilmSessionPostPutPatchSerializer, PurchaseGetSerializer, PurchasePostSerializer, MyUserPostSerializer, \
+    SeatBookingSerializer, SeatHoldSerializer, CheckoutSerializer, ArchivedFilmSessionSerializer, \
+    ArchivedPurchaseSerializer
+from cinapp.models import CustomToken, Film, Hall, FilmSession, Purchase, SeatHold, ArchivedFilmSession, \
+    ArchivedPurchase
+from cinapp.pagination import FilmSessionCursorPagination, PurchaseCursorPagination
+from cinapp.analytics import sales_analytics
+from cinapp.caching import registry, session_listing, listing_params
+from cinapp.idempotency import idempotent
+from cinapp.exports import EXPORT_FORMATS, parse_day, purchase_rows
+from cinapp.reports import DIMENSIONS, box_office, day_bounds
+from cinapp.reservations import reserve_seats, checkout_cart, hold_seats, confirm_hold, cancel_hold, resize_hall
+from cinapp.schedule import FilmSessionImportSerializer, import_sessions
+from cinapp.seatmap import SeatMap
+from rest_framework import mixins, serializers, status
+from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.viewsets import ModelViewSet, GenericViewSet
 from rest_framework import permissions
 from rest_framework.generics import CreateAPIView
+from rest_framework.views import APIView
+from django.db import transaction
 from django.contrib.auth import get_user_model
+from django.http import StreamingHttpResponse
 
 UserModel = get_user_model()
 
@@ -37,6 +54,73 @@ class CustomAuthToken(ObtainAuthToken):
         })
 
 
+class CacheStatsView(APIView):
+    permission_classes = [IsSuperUser]
+
+    def get(self, request):
+        return Response({name: cache.stats() for name, cache in registry.items()})
+
+
+class PurchaseExportView(APIView):
+    permission_classes = [IsSuperUser]
+
+    def get(self, request):
+        output = request.GET.get('output', 'csv')
+        if output not in EXPORT_FORMATS:
+            return Response({'output': 'Choose one of: %s' % ', '.join(sorted(EXPORT_FORMATS))},
+                            status=status.HTTP_400_BAD_REQUEST)
+        dates = {}
+        for param in ('from', 'to'):
+            try:
+                dates[param] = parse_day(request.GET[param]) if request.GET.get(param) else None
+            except ValueError:
+                return Response({param: 'Use YYYY-MM-DD'}, status=status.HTTP_400_BAD_REQUEST)
+        lines, content_type = EXPORT_FORMATS[output]
+        response = StreamingHttpResponse(lines(purchase_rows(dates['from'], dates['to'])), content_type=content_type)
+        response['Content-Disposition'] = 'attachment; filename="purchases.%s"' % output
+        return response
+
+
+class BoxOfficeView(APIView):
+    permission_classes = [IsSuperUser]
+
+    def get(self, request):
+        group_by = [name for name in request.GET.get('group_by', 'day').split(',') if name]
+        if not group_by or set(group_by) - set(DIMENSIONS):
+            return Response({'group_by': 'Choose from: %s' % ', '.join(DIMENSIONS)},
+                            status=status.HTTP_400_BAD_REQUEST)
+        dates = {}
+        for param in ('from', 'to'):
+            try:
+                dates[param] = parse_day(request.GET[param]) if request.GET.get(param) else None
+            except ValueError:
+                return Response({param: 'Use YYYY-MM-DD'}, status=status.HTTP_400_BAD_REQUEST)
+        ids = {}
+        for param in ('film', 'hall'):
+            try:
+                ids[param] = int(request.GET[param]) if request.GET.get(param) else None
+            except ValueError:
+                return Response({param: 'Use an id'}, status=status.HTTP_400_BAD_REQUEST)
+        rows = box_office(group_by, dates['from'], dates['to'], film=ids['film'], hall=ids['hall'],
+                          city=request.GET.get('city'))
+        return Response(rows)
+
+
+class AnalyticsView(APIView):
+    permission_classes = [IsSuperUser]
+
+    def get(self, request):
+        today = datetime.date.today()
+        dates = {'from': today - datetime.timedelta(days=365), 'to': today}
+        for param in ('from', 'to'):
+            try:
+                if request.GET.get(param):
+                    dates[param] = parse_day(request.GET[param])
+            except ValueError:
+                return Response({param: 'Use YYYY-MM-DD'}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(sales_analytics(dates['from'], dates['to']))
+
+
 class FilmModelViewSet(mixins.CreateModelMixin,
                        mixins.RetrieveModelMixin,
                        mixins.ListModelMixin,
@@ -53,24 +137,65 @@ class HallModelViewSet(ModelViewSet):
     permission_classes = [IsAdminOrReadOnly]
 
     def perform_update(self, serializer):
-        name = serializer.validated_data['name']
-        size = serializer.validated_data['size']
-        if FilmSession.objects.filter(hall__name=name).exists():
-            FilmSession.objects.filter(hall__name=name).update(hall_size=size)
-            serializer.save()
-        serializer.save()
+        resized = serializer.validated_data['size'] != serializer.instance.size
+        with transaction.atomic():
+            hall = serializer.save()
+            if resized:
+                resize_hall(hall)
 
 
 class FilmSessionModelViewSet(ModelViewSet):
-    queryset = FilmSession.objects.all()
+    queryset = FilmSession.objects.select_related('film', 'hall')
     permission_classes = [IsAdminOrReadOnly]
+    pagination_class = FilmSessionCursorPagination
 
     def get_serializer_class(self):
+        if self.action == 'seats':
+            return SeatBookingSerializer
+        if self.action == 'bulk':
+            return FilmSessionImportSerializer
         if self.request.method != 'GET':
             return FilmSessionPostPutPatchSerializer
         else:
             return FilmSessionGetSerializer
 
+    def list(self, request, *args, **kwargs):
+        params = listing_params(request, ['start', 'end', 'hall', self.paginator.cursor_query_param])
+        return Response(session_listing.get_or_build(params, lambda: super(FilmSessionModelViewSet, self).list(
+            request, *args, **kwargs).data))
+
+    @action(detail=True, methods=['get', 'post'], permission_classes=[permissions.IsAuthenticatedOrReadOnly])
+    @idempotent
+    def seats(self, request, pk=None):
+        film_session = self.get_object()
+        if request.method == 'POST':
+            serializer = self.get_serializer(data=request.data)
+            serializer.is_valid(raise_exception=True)
+            purchase = reserve_seats(request.user, film_session, None, seats=serializer.validated_data['seats'])
+            return Response(PurchaseGetSerializer(purchase).data, status=status.HTTP_201_CREATED)
+        seat_map = SeatMap.for_session(film_session)
+        data = {
+            'rows': seat_map.rows,
+            'row_size': seat_map.row_size,
+            'free': seat_map.free_count,
+            'layout': seat_map.layout(),
+        }
+        adjacent = request.GET.get('adjacent')
+        if adjacent and adjacent.isdigit():
+            data['adjacent'] = seat_map.find_adjacent(int(adjacent))
+        return Response(data)
+
+    @action(detail=False, methods=['post'])
+    def bulk(self, request):
+        if request.content_type.startswith('text/csv'):
+            rows = list(csv.DictReader(io.StringIO(request.body.decode('utf-8'))))
+        else:
+            rows = request.data
+        created, errors = import_sessions(rows)
+        if errors:
+            return Response({'errors': errors}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({'created': created}, status=status.HTTP_201_CREATED)
+
     def perform_create(self, serializer):
         hall = serializer.validated_data['hall']
         hall_size = hall.size
@@ -102,7 +227,7 @@ class FilmSessionModelViewSet(ModelViewSet):
             return None
         except TypeError:
             if hall:
-                return qs.filter(start__contains=today, hall__name__iexact=hall)
+                return qs.on_day(today).filter(hall__name__iexact=hall)
         return qs.all()
 
 
@@ -110,26 +235,34 @@ class PurchaseModelViewSet(mixins.CreateModelMixin,
                            mixins.RetrieveModelMixin,
                            mixins.ListModelMixin,
                            GenericViewSet):
-    queryset = Purchase.objects.all()
+    queryset = Purchase.objects.select_related('film_session__film', 'film_session__hall', 'user')
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = PurchaseCursorPagination
+
+    @idempotent
+    def create(self, request, *args, **kwargs):
+        return super().create(request, *args, **kwargs)
+
+    @action(detail=False, methods=['post'])
+    @idempotent
+    def checkout(self, request):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        purchases = checkout_cart(request.user, serializer.validated_data['lines'])
+        return Response(PurchaseGetSerializer(purchases, many=True).data, status=status.HTTP_201_CREATED)
 
     def get_serializer_class(self):
+        if self.action == 'checkout':
+            return CheckoutSerializer
         if self.request.method != 'GET':
             return PurchasePostSerializer
         else:
             return PurchaseGetSerializer
 
     def perform_create(self, serializer):
-        my_user = self.request.user
         film_session = serializer.validated_data['film_session']
         count_ = serializer.validated_data['count']
-        sum_ = count_ * film_session.price
-        film_session.hall_size = film_session.hall_size - count_
-        my_user.wallet = my_user.wallet - sum_
-        with transaction.atomic():
-            film_session.save()
-            my_user.save()
-            serializer.save(user=my_user)
+        serializer.instance = reserve_seats(self.request.user, film_session, count_)
 
     def get_queryset(self):
         qs = super().get_queryset()
@@ -137,3 +270,71 @@ class PurchaseModelViewSet(mixins.CreateModelMixin,
             return qs.all()
         else:
             return qs.filter(user=self.request.user)
+
+
+class SeatHoldViewSet(mixins.RetrieveModelMixin,
+                      mixins.ListModelMixin,
+                      mixins.DestroyModelMixin,
+                      GenericViewSet):
+    queryset = SeatHold.objects.order_by('expires_at', 'id')
+    permission_classes = [permissions.IsAuthenticated]
+    serializer_class = SeatHoldSerializer
+
+    def create(self, request):
+        serializer = PurchasePostSerializer(data=request.data, context=self.get_serializer_context())
+        serializer.is_valid(raise_exception=True)
+        hold = hold_seats(request.user, serializer.validated_data['film_session'], serializer.validated_data['count'])
+        return Response(SeatHoldSerializer(hold).data, status=status.HTTP_201_CREATED)
+
+    @action(detail=True, methods=['post'])
+    @idempotent
+    def confirm(self, request, pk=None):
+        purchase = confirm_hold(request.user, pk)
+        return Response(PurchaseGetSerializer(purchase).data, status=status.HTTP_201_CREATED)
+
+    def perform_destroy(self, instance):
+        cancel_hold(self.request.user, instance.id)
+
+    def get_queryset(self):
+        return super().get_queryset().filter(user=self.request.user)
+
+
+def archive_period(request, field, queryset):
+    # Optional ?from= and ?to= days, both included.
+    for param in ('from', 'to'):
+        if request.GET.get(param):
+            try:
+                day = parse_day(request.GET[param])
+            except ValueError:
+                raise serializers.ValidationError({param: 'Use YYYY-MM-DD'})
+            start, end = day_bounds(day, day)
+            queryset = queryset.filter(**{field + '__gte': start} if param == 'from' else {field + '__lt': end})
+    return queryset
+
+
+class ArchivedFilmSessionViewSet(mixins.RetrieveModelMixin,
+                                 mixins.ListModelMixin,
+                                 GenericViewSet):
+    # History moved out of the live tables by archive_sessions or by deletes; never written through the API.
+    queryset = ArchivedFilmSession.objects.all()
+    serializer_class = ArchivedFilmSessionSerializer
+    permission_classes = [IsAdminOrReadOnly]
+    pagination_class = FilmSessionCursorPagination
+
+    def get_queryset(self):
+        return archive_period(self.request, 'start', super().get_queryset())
+
+
+class ArchivedPurchaseViewSet(mixins.RetrieveModelMixin,
+                              mixins.ListModelMixin,
+                              GenericViewSet):
+    queryset = ArchivedPurchase.objects.select_related('film_session')
+    serializer_class = ArchivedPurchaseSerializer
+    permission_classes = [permissions.IsAuthenticated]
+    pagination_class = PurchaseCursorPagination
+
+    def get_queryset(self):
+        qs = archive_period(self.request, 'created_at', super().get_queryset())
+        if self.request.user.is_superuser:
+            return qs
+        return qs.filter(user=self.request.user)
@@ -1,9 +1,7 @@
-import datetime
-
 from django.contrib.auth import get_user_model
-from django.db.models import Q
 from rest_framework.serializers import ModelSerializer
-from cinapp.models import Film, Hall, MyUser, FilmSession, Purchase
+from cinapp.models import Film, Hall, MyUser, FilmSession, Purchase, SeatHold, ArchivedFilmSession, ArchivedPurchase
+from cinapp.validation import film_errors, hall_errors, purchase_errors, raise_first, session_errors
 from rest_framework import serializers
 
 UserModel = get_user_model()
@@ -33,18 +31,8 @@ class FilmSerializer(ModelSerializer):
         fields = '__all__'
 
     def validate(self, attrs):
-        min_length = datetime.timedelta(minutes=30, hours=1)
-        max_length = datetime.timedelta(hours=4)
-        if attrs['length'] < min_length:
-            raise serializers.ValidationError('Film length must be greater than 01:30:00')
-        if attrs['length'] > max_length:
-            raise serializers.ValidationError('Film length must be lower than 04:00:00')
-        if attrs['start_premier'] > attrs['end_premier']:
-            raise serializers.ValidationError('Your premier date is wrong')
-        if Film.objects.filter(name__iexact=attrs['name'], start_premier=attrs['start_premier'],
-                               end_premier=attrs['end_premier'], length=attrs['length'],
-                               genre=attrs['genre']).exists():
-            raise serializers.ValidationError('You already have added this film')
+        raise_first(film_errors(attrs['name'], attrs['start_premier'], attrs['end_premier'], attrs['length'],
+                                attrs['genre']))
         return attrs
 
 
@@ -54,16 +42,8 @@ class HallSerializer(ModelSerializer):
         fields = '__all__'
 
     def validate(self, attrs):
-        if attrs['size'] <= 0:
-            raise serializers.ValidationError('Size of the hall must be greater than zero')
-        try:
-            if Hall.objects.filter(~Q(id=self.instance.pk), name__iexact=attrs['name']).exists():
-                raise serializers.ValidationError('There already has been hall with this name')
-        except AttributeError:
-            if Hall.objects.filter(name__iexact=attrs['name']).exists():
-                raise serializers.ValidationError('There already has been hall with this name')
-        if Purchase.objects.filter(film_session__hall__name__iexact=attrs['name']).exists():
-            raise serializers.ValidationError('You can not edit this hall because tickets with this one was sold')
+        row_size = attrs.get('row_size', getattr(self.instance, 'row_size', 1))
+        raise_first(hall_errors(attrs['name'], attrs['size'], row_size, self.instance))
         return attrs
 
 
@@ -73,7 +53,7 @@ class FilmSessionGetSerializer(ModelSerializer):
 
     class Meta:
         model = FilmSession
-        fields = '__all__'
+        exclude = ('seats',)
 
 
 class FilmSessionPostPutPatchSerializer(ModelSerializer):
@@ -82,33 +62,8 @@ class FilmSessionPostPutPatchSerializer(ModelSerializer):
         fields = ('film', 'hall', 'start', 'end', 'price')
 
     def validate(self, attrs):
-        q1 = Q(start__gt=attrs['start'])
-        q2 = Q(start__gte=attrs['end'])
-        q3 = Q(end__lte=attrs['start'])
-        film = attrs['film']
-        delta = attrs['end'] - attrs['start']
-        if delta > (film.length + datetime.timedelta(minutes=20)) or delta < film.length:
-            raise serializers.ValidationError('Your session time is incorrect ')
-        if attrs['start'] >= attrs['end']:
-            raise serializers.ValidationError('Something is wrong with your session')
-        if attrs['start'].date() < film.start_premier:
-            raise serializers.ValidationError('The start of session does not consist with premier')
-        if attrs['end'].date() > film.end_premier:
-            raise serializers.ValidationError('The end of session does not consist with premier')
-        if attrs['price'] <= 0:
-            raise serializers.ValidationError('Enter a correct price!')
-        try:
-            if Purchase.objects.filter(film_session__id=self.instance.pk).exists():
-                raise serializers.ValidationError(
-                    'You can not edit this session because tickets with this one was sold')
-            else:
-                if FilmSession.objects.filter(~((q1 & q2) | q3), ~Q(id=self.instance.pk), hall=attrs['hall']).exists():
-                    raise serializers.ValidationError('This time in that hall is booked, please choose another '
-                                                      'hall or time')
-        except AttributeError:
-            if FilmSession.objects.filter(~((q1 & q2) | q3), hall=attrs['hall']).exists():
-                raise serializers.ValidationError(
-                    'This time in that hall is booked, please choose another hall or time')
+        raise_first(session_errors(attrs['film'], attrs['hall'], attrs['start'], attrs['end'], attrs['price'],
+                                   getattr(self.instance, 'pk', None)))
         return attrs
 
 
@@ -121,6 +76,20 @@ class PurchaseGetSerializer(ModelSerializer):
         fields = '__all__'
 
 
+class ArchivedFilmSessionSerializer(ModelSerializer):
+    class Meta:
+        model = ArchivedFilmSession
+        fields = '__all__'
+
+
+class ArchivedPurchaseSerializer(ModelSerializer):
+    film_session = ArchivedFilmSessionSerializer()
+
+    class Meta:
+        model = ArchivedPurchase
+        fields = '__all__'
+
+
 class PurchasePostSerializer(ModelSerializer):
     class Meta:
         model = Purchase
@@ -131,14 +100,29 @@ class PurchasePostSerializer(ModelSerializer):
         super().__init__(*args, **kwargs)
 
     def validate(self, attrs):
-        film_session = attrs['film_session']
-        sum_ = film_session.price * attrs['count']
-        if FilmSession.objects.filter(start__lt=datetime.datetime.now(), id=film_session.id):
-            raise serializers.ValidationError('You can not buy ticket for this session because this one has already started')
-        if attrs['count'] <= 0:
-            raise serializers.ValidationError('You should select one more tickets')
-        if attrs['count'] > film_session.hall_size:
-            raise serializers.ValidationError('Sorry, not enough tickets')
-        if sum_ > self.context['request'].user.wallet:
-            raise serializers.ValidationError('Not enough money')
+        raise_first(purchase_errors(self.context['request'].user, attrs['film_session'], attrs['count']))
         return attrs
+
+
+class CartLineSerializer(serializers.Serializer):
+    film_session = serializers.IntegerField()
+    count = serializers.IntegerField(min_value=1)
+
+
+class CheckoutSerializer(serializers.Serializer):
+    lines = CartLineSerializer(many=True, allow_empty=False)
+
+    def validate_lines(self, lines):
+        if len(lines) > 20:
+            raise serializers.ValidationError('A cart can hold at most 20 lines')
+        return lines
+
+
+class SeatHoldSerializer(ModelSerializer):
+    class Meta:
+        model = SeatHold
+        fields = ('id', 'film_session', 'count', 'seats', 'created_at', 'expires_at')
+
+
+class SeatBookingSerializer(serializers.Serializer):
+    seats = serializers.ListField(child=serializers.IntegerField(min_value=0), allow_empty=False)
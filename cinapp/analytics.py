@@ -0,0 +1,110 @@
+import numpy as np
+from django.db import connection
+from django.db.models import F, FloatField, IntegerField, Sum, Value
+from django.db.models.functions import Cast, Ceil, Extract, ExtractHour, Greatest, Least
+from cinapp.models import Film, FilmSession, Purchase, ArchivedFilmSession, ArchivedPurchase
+from cinapp.reports import day_bounds
+
+GENRES = {int(code): name for code, name in Film.CHOICE_GENRE}
+GENRE_SLOTS = max(GENRES) + 1
+
+LEAD_HOURS = (168, 72, 48, 24, 12, 6, 3, 1, 0)
+
+
+def fetch(queryset, fields, chunk_size=100000):
+    # Rows go straight from a server-side cursor into float64 columns; Django's per-row
+    # converters are skipped, which is most of the cost on millions of rows.
+    query = queryset.values_list(*fields).query
+    # Annotations are selected after plain fields whatever the order asked for.
+    columns = [*query.values_select, *query.annotation_select]
+    sql, params = query.sql_with_params()
+    chunks = []
+    with connection.chunked_cursor() as cursor:
+        cursor.execute(sql, params)
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            chunks.append(np.array(rows, dtype=np.float64))
+    data = np.concatenate(chunks) if chunks else np.empty((0, len(fields)))
+    return data.T[[columns.index(name) for name in fields]]
+
+
+def load(start, end):
+    # Archived sessions count with their purchases, so deleting a hall or a film keeps its sales
+    # in the figures. Their hall may be gone: they offered the seats left unsold, kept in
+    # hall_size, plus those they sold.
+    columns = ('id', 'hour', 'genre_code', 'size', 'price')
+    live = fetch(FilmSession.objects.filter(start__gte=start, start__lt=end).order_by().annotate(
+        hour=ExtractHour('start'), genre_code=Cast('film__genre', IntegerField()), size=F('hall__size')), columns)
+    archived = fetch(ArchivedFilmSession.objects.filter(start__gte=start, start__lt=end).order_by().annotate(
+        hour=ExtractHour('start'), genre_code=Cast('film_genre', IntegerField()), size=F('hall_size')), columns)
+    order = np.argsort(np.concatenate((live[0], archived[0])), kind='stable')
+    session_id, hour, genre, capacity, price = np.concatenate((live, archived), axis=1)[:, order]
+    was_archived = order >= live.shape[1]
+    # Tickets are summed per session and whole hour before the start in the database, so
+    # a year of purchases arrives as at most LEAD_HOURS[0] + 2 rows per session.
+    hours = Ceil(Cast(Extract(F('film_session__start') - F('created_at'), 'epoch'), FloatField()) / 3600)
+    lead = Greatest(Least(hours, Value(LEAD_HOURS[0] + 1.0)), Value(0.0))
+    bought_for, lead, count = np.concatenate([
+        fetch(model.objects.filter(film_session__start__gte=start, film_session__start__lt=end).order_by(
+            ).values('film_session_id', lead=lead).annotate(tickets=Sum('count')),
+            ('film_session_id', 'lead', 'tickets'))
+        for model in (Purchase, ArchivedPurchase)], axis=1)
+    sold = np.bincount(np.searchsorted(session_id, bought_for).astype(np.int64), weights=count,
+                       minlength=len(session_id)).astype(np.float64)
+    capacity = np.where(was_archived, capacity + sold, capacity)
+    return {
+        'hour': hour.astype(np.int64), 'genre': genre.astype(np.int64), 'capacity': capacity, 'price': price,
+        'sold': sold, 'count': count, 'lead': lead,
+    }
+
+
+def occupancy_curve(data):
+    # Share of seats still free N hours before the start, over all sessions of the period.
+    capacity = data['capacity'].sum()
+    order = np.argsort(data['lead'])
+    sold_by = np.concatenate(([0], np.cumsum(data['count'][order])))
+    position = np.searchsorted(data['lead'][order], LEAD_HOURS, side='right')
+    sold_earlier = sold_by[-1] - sold_by[position]
+    remaining = 1 - sold_earlier / capacity if capacity else np.ones(len(LEAD_HOURS))
+    return [{'hours_before_start': hours, 'remaining': round(float(share), 4)}
+            for hours, share in zip(LEAD_HOURS, remaining)]
+
+
+def fill_rates(data):
+    # Sold seats over offered seats per genre and hour of day of the start.
+    slot = data['genre'] * 24 + data['hour']
+    size = GENRE_SLOTS * 24
+    sessions = np.bincount(slot, minlength=size)
+    sold = np.bincount(slot, weights=data['sold'], minlength=size)
+    offered = np.bincount(slot, weights=data['capacity'], minlength=size)
+    return [{'genre': GENRES[key // 24], 'hour': int(key % 24), 'sessions': int(sessions[key]),
+             'fill_rate': round(float(sold[key] / offered[key]), 4)}
+            for key in np.flatnonzero(offered)]
+
+
+def price_elasticity(data):
+    # Slope of log(fill rate) against log(price) per genre, by grouped least squares.
+    fill = np.divide(data['sold'], data['capacity'], out=np.zeros_like(data['sold']), where=data['capacity'] > 0)
+    usable = (fill > 0) & (data['price'] > 0)
+    x, y, genre = np.log(data['price'][usable]), np.log(fill[usable]), data['genre'][usable]
+    n = np.bincount(genre, minlength=GENRE_SLOTS)
+    sx, sy = np.bincount(genre, x, GENRE_SLOTS), np.bincount(genre, y, GENRE_SLOTS)
+    sxx, sxy = np.bincount(genre, x * x, GENRE_SLOTS), np.bincount(genre, x * y, GENRE_SLOTS)
+    spread = n * sxx - sx * sx
+    rows = []
+    for code in np.flatnonzero(n):
+        slope = (n[code] * sxy[code] - sx[code] * sy[code]) / spread[code] if spread[code] else None
+        rows.append({'genre': GENRES[code], 'sessions': int(n[code]),
+                     'elasticity': round(float(slope), 4) if slope is not None else None})
+    return rows
+
+
+def sales_analytics(day_from, day_to):
+    data = load(*day_bounds(day_from, day_to))
+    return {
+        'occupancy_curve': occupancy_curve(data),
+        'fill_rates': fill_rates(data),
+        'price_elasticity': price_elasticity(data),
+    }
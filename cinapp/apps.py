@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class CinappConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'cinapp'
+
+    def ready(self):
+        from cinapp import signals  # noqa: F401
@@ -0,0 +1,14 @@
+import datetime
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from cinapp.models import FilmSession
+
+
+def archive_ended(batch_size=1000):
+    # One batch of sessions that ended ARCHIVE_AFTER_DAYS ago, lowest ids first, in its own
+    # transaction, so listings and purchases never wait long on the mover.
+    cutoff = timezone.now() - datetime.timedelta(days=settings.ARCHIVE_AFTER_DAYS)
+    with transaction.atomic():
+        return FilmSession.objects.filter(end__lt=cutoff).archive(batch_size, limit=batch_size)
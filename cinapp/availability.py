@@ -0,0 +1,126 @@
+import asyncio
+import contextlib
+import json
+import select
+import threading
+
+from django.conf import settings
+from django.db import connection, connections, transaction
+
+QUEUE_SIZE = 16
+
+
+class LocalBroker:
+    # In-process pub/sub of seat availability. A publish costs one callback per event
+    # loop with watchers, not one per watcher, and may come from any thread. Events
+    # carry the whole state, so a watcher that falls behind only loses stale ones.
+
+    def __init__(self):
+        self.subscribers = {}
+        self.lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def subscribe(self, session_id):
+        queue = asyncio.Queue(QUEUE_SIZE)
+        loop = asyncio.get_running_loop()
+        with self.lock:
+            self.subscribers.setdefault(session_id, {})[queue] = loop
+        try:
+            yield queue
+        finally:
+            with self.lock:
+                watchers = self.subscribers[session_id]
+                del watchers[queue]
+                if not watchers:
+                    del self.subscribers[session_id]
+
+    def publish(self, session_id, event):
+        with self.lock:
+            loops = set(self.subscribers.get(session_id, {}).values())
+        for loop in loops:
+            try:
+                loop.call_soon_threadsafe(self.deliver, session_id, event, loop)
+            except RuntimeError:
+                # The loop has been closed since it subscribed.
+                pass
+
+    def publish_many(self, events):
+        for session_id, event in events:
+            self.publish(session_id, event)
+
+    def deliver(self, session_id, event, loop):
+        with self.lock:
+            queues = [queue for queue, owner in self.subscribers.get(session_id, {}).items() if owner is loop]
+        for queue in queues:
+            if queue.full():
+                queue.get_nowait()
+            queue.put_nowait(event)
+
+    def watchers(self):
+        with self.lock:
+            return sum(len(watchers) for watchers in self.subscribers.values())
+
+
+class PostgresBroker(LocalBroker):
+    # NOTIFY reaches every process listening on the database, so watchers connected to
+    # one worker also see purchases made through any other one, WSGI workers included.
+    # Each process keeps one extra connection that LISTENs and fans events out locally.
+    channel = 'cinapp_availability'
+
+    def __init__(self):
+        super().__init__()
+        self.listener = None
+
+    def subscribe(self, session_id):
+        with self.lock:
+            if self.listener is None:
+                self.listener = threading.Thread(target=self.listen, daemon=True)
+                self.listener.start()
+        return super().subscribe(session_id)
+
+    def publish(self, session_id, event):
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_notify(%s, %s)', [self.channel, json.dumps([session_id, event])])
+
+    def publish_many(self, events):
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_notify(%s, payload) FROM unnest(%s::text[]) AS payload',
+                           [self.channel, [json.dumps(item) for item in events]])
+
+    def listen(self):
+        database = connections['default']
+        listening = database.get_new_connection(database.get_connection_params())
+        try:
+            listening.autocommit = True
+            listening.cursor().execute('LISTEN %s' % self.channel)
+            while True:
+                select.select([listening], [], [], 5)
+                listening.poll()
+                while listening.notifies:
+                    session_id, event = json.loads(listening.notifies.pop(0).payload)
+                    super().publish(session_id, event)
+        finally:
+            # The next subscriber starts a new listener.
+            with self.lock:
+                self.listener = None
+            listening.close()
+
+
+def make_broker(name):
+    if name == 'postgres':
+        return PostgresBroker()
+    return LocalBroker()
+
+
+broker = make_broker(settings.AVAILABILITY_BROKER)
+
+
+def announce(session_id, hall_size):
+    # After commit, so watchers never see seats taken by a purchase that was rolled back.
+    transaction.on_commit(lambda: broker.publish(session_id, {'hall_size': hall_size}))
+
+
+def announce_many(remaining):
+    # remaining: (session_id, hall_size) pairs, sent together after commit.
+    events = [(session_id, {'hall_size': hall_size}) for session_id, hall_size in remaining]
+    transaction.on_commit(lambda: broker.publish_many(events))
@@ -0,0 +1,154 @@
+import datetime
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.http import urlencode
+
+registry = {}
+
+
+class VersionedCache:
+    # Entries are keyed by a version number kept in the cache itself; bumping it
+    # invalidates every entry at once and works the same across worker processes.
+    # Hit/miss counters are per process.
+
+    def __init__(self, name, alias='default', timeout=300):
+        self.name = name
+        self.alias = alias
+        self.timeout = timeout
+        self.enabled = True
+        self.hits = 0
+        self.misses = 0
+        registry[name] = self
+
+    @property
+    def backend(self):
+        return caches[self.alias]
+
+    def version(self):
+        key = '%s:version' % self.name
+        version = self.backend.get(key)
+        if version is None:
+            # Seeded from the clock so an evicted version never comes back to stale entries.
+            self.backend.add(key, int(time.time() * 1000), None)
+            version = self.backend.get(key)
+        return version
+
+    def make_key(self, params):
+        return '%s:%s:%s' % (self.name, self.version(), urlencode(sorted(params.items())))
+
+    def get_or_build(self, params, build):
+        if not self.enabled:
+            return build()
+        key = self.make_key(params)
+        value = self.backend.get(key)
+        if value is None:
+            self.misses += 1
+            value = build()
+            self.backend.set(key, value, self.timeout)
+        else:
+            self.hits += 1
+        return value
+
+    def invalidate(self):
+        key = '%s:version' % self.name
+        try:
+            self.backend.incr(key)
+        except ValueError:
+            self.backend.add(key, int(time.time() * 1000), None)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {'hits': self.hits, 'misses': self.misses, 'hit_rate': self.hits / total if total else None}
+
+
+class LocalCache:
+    # Bounded LRU with a per-entry TTL, private to the process.
+
+    def __init__(self, name, maxsize=1024, timeout=60):
+        self.name = name
+        self.maxsize = maxsize
+        self.timeout = timeout
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        registry[name] = self
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self.entries[key]
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, value):
+        with self.lock:
+            self.entries[key] = (time.monotonic() + self.timeout, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def delete(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {'hits': self.hits, 'misses': self.misses, 'hit_rate': self.hits / total if total else None,
+                'size': len(self.entries)}
+
+
+class SharedCache:
+    # Same interface as LocalCache on top of a Django cache alias, e.g. Redis shared by all workers.
+
+    def __init__(self, name, alias, timeout=60):
+        self.name = name
+        self.alias = alias
+        self.timeout = timeout
+        self.hits = 0
+        self.misses = 0
+        registry[name] = self
+
+    def get(self, key):
+        value = caches[self.alias].get('%s:%s' % (self.name, key))
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def set(self, key, value):
+        caches[self.alias].set('%s:%s' % (self.name, key), value, self.timeout)
+
+    def delete(self, key):
+        caches[self.alias].delete('%s:%s' % (self.name, key))
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {'hits': self.hits, 'misses': self.misses, 'hit_rate': self.hits / total if total else None}
+
+
+def make_cache(name, alias, maxsize, timeout):
+    if alias == 'local':
+        return LocalCache(name, maxsize=maxsize, timeout=timeout)
+    return SharedCache(name, alias, timeout=timeout)
+
+
+session_listing = VersionedCache('session-listing', alias=settings.SESSION_LIST_CACHE,
+                                 timeout=settings.SESSION_LIST_CACHE_TIMEOUT)
+
+
+def listing_params(request, names):
+    # Relative filters like "today" depend on the date, so it is always part of the key.
+    params = {name: request.GET[name] for name in names if request.GET.get(name) is not None}
+    params['date'] = datetime.date.today().isoformat()
+    return params
@@ -0,0 +1,62 @@
+import csv
+import datetime
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from cinapp.models import Purchase, ArchivedPurchase
+
+EXPORT_FIELDS = ('id', 'created_at', 'user__username', 'user__city', 'film_session__film__name',
+                 'film_session__hall__name', 'film_session__start', 'film_session__price', 'count')
+
+ARCHIVED_EXPORT_FIELDS = ('id', 'created_at', 'user__username', 'user__city', 'film_session__film_name',
+                          'film_session__hall_name', 'film_session__start', 'film_session__price', 'count')
+
+EXPORT_HEADER = ('id', 'created_at', 'username', 'city', 'film', 'hall', 'session_start', 'price', 'count', 'total')
+
+
+def parse_day(value):
+    day = parse_date(value)
+    if day is None:
+        raise ValueError('Use YYYY-MM-DD')
+    return day
+
+
+def purchase_rows(date_from=None, date_to=None, chunk_size=2000):
+    # One query over the live and the archived purchases, which keep their ids, read through a
+    # server-side cursor; rows are tuples, never model instances.
+    live, archived = Purchase.objects.order_by(), ArchivedPurchase.objects.order_by()
+    if date_from:
+        since = timezone.make_aware(datetime.datetime.combine(date_from, datetime.time.min))
+        live, archived = live.filter(created_at__gte=since), archived.filter(created_at__gte=since)
+    if date_to:
+        day_after = date_to + datetime.timedelta(days=1)
+        until = timezone.make_aware(datetime.datetime.combine(day_after, datetime.time.min))
+        live, archived = live.filter(created_at__lt=until), archived.filter(created_at__lt=until)
+    qs = live.values_list(*EXPORT_FIELDS).union(archived.values_list(*ARCHIVED_EXPORT_FIELDS), all=True)
+    for row in qs.order_by('id').iterator(chunk_size=chunk_size):
+        yield row + (row[7] * row[8],)
+
+
+class Echo:
+    def write(self, value):
+        return value
+
+
+def csv_lines(rows):
+    writer = csv.writer(Echo())
+    yield writer.writerow(EXPORT_HEADER)
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def ndjson_lines(rows):
+    for row in rows:
+        yield json.dumps(dict(zip(EXPORT_HEADER, row)), cls=DjangoJSONEncoder) + '\n'
+
+
+EXPORT_FORMATS = {
+    'csv': (csv_lines, 'text/csv'),
+    'ndjson': (ndjson_lines, 'application/x-ndjson'),
+}
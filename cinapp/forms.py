@@ -1,12 +1,8 @@
-import datetime
-
-import pytz
 from django import forms
 from django.contrib.auth.forms import UserCreationForm
-from django.core.exceptions import ValidationError
-from django.db.models import Q
 from django.forms import ModelForm
 from .models import MyUser, Film, FilmSession, Purchase, Hall
+from .validation import add_errors, film_errors, hall_errors, purchase_errors, session_errors
 
 
 class MyUserCreationForm(UserCreationForm):
@@ -22,27 +18,14 @@ class AddFilmForm(ModelForm):
 
     def clean(self):
         cleaned_data = super().clean()
-        start_premier = cleaned_data.get('start_premier')
-        end_premier = cleaned_data.get('end_premier')
-        name = cleaned_data.get('name')
-        length = cleaned_data.get('length')
-        genre = cleaned_data.get('genre')
-        min_length = datetime.timedelta(minutes=30, hours=1)
-        max_length = datetime.timedelta(hours=4)
-        if start_premier is None:
+        if cleaned_data.get('start_premier') is None:
             self.add_error('start_premier', 'Incorrect date')
-        elif end_premier is None:
+        elif cleaned_data.get('end_premier') is None:
             self.add_error('end_premier', 'Incorrect date')
-        else:
-            if length < min_length:
-                self.add_error('length', 'Film length must be greater than 01:30:00')
-            if length > max_length:
-                self.add_error('length', 'Film length must be lower than 04:00:00')
-            if start_premier > end_premier:
-                self.add_error('start_premier', 'Your premier date is wrong')
-            if Film.objects.filter(name__iexact=name, start_premier=start_premier, end_premier=end_premier, length=length,
-                                   genre=genre).exists():
-                self.add_error('name', 'You already have added this film')
+        elif cleaned_data.get('length') is not None:
+            add_errors(self, film_errors(cleaned_data.get('name'), cleaned_data['start_premier'],
+                                         cleaned_data['end_premier'], cleaned_data['length'],
+                                         cleaned_data.get('genre')))
 
 
 class HallForm(ModelForm):
@@ -50,19 +33,13 @@ class HallForm(ModelForm):
         model = Hall
         fields = '__all__'
 
-    def clean_size(self):
-        size = self.cleaned_data.get('size')
-        if size <= 0:
-            raise ValidationError('Size must be greater than zero')
-        return size
-
     def clean(self):
         cleaned_data = super().clean()
-        name = cleaned_data.get('name')
-        if Purchase.objects.filter(film_session__hall__id=self.instance.pk).exists():
-            self.add_error('name', 'You can not edit this hall because tickets with this one was sold')
-        if Hall.objects.filter(~Q(id=self.instance.pk), name__iexact=name).exists():
-            self.add_error('name', 'There already has been hall with this name')
+        size = cleaned_data.get('size')
+        row_size = cleaned_data.get('row_size')
+        if size is not None and row_size is not None:
+            add_errors(self, hall_errors(cleaned_data.get('name'), size, row_size,
+                                         self.instance if self.instance.pk else None))
 
 
 class FilmSessionForm(ModelForm):
@@ -72,35 +49,17 @@ class FilmSessionForm(ModelForm):
 
     def clean(self): # Валидация
         cleaned_data = super().clean()
-        hall = cleaned_data.get('hall')
         start = cleaned_data.get('start')
         end = cleaned_data.get('end')
         film = cleaned_data.get('film')
+        hall = cleaned_data.get('hall')
         price = cleaned_data.get('price')
-        q3 = Q(start__gt=start)
-        q4 = Q(start__gte=end)
-        q5 = Q(end__lte=start)
-        if Purchase.objects.filter(film_session__id=self.instance.pk).exists():
-            self.add_error('film', 'You can not edit this session because tickets with this one was sold')
-        else:
-            if start is None:
-                self.add_error('start', 'incorrect date')
-            elif end is None:
-                self.add_error('end', 'Incorrect date')
-            else:
-                delta = end - start
-                if delta > (film.length + datetime.timedelta(minutes=20)) or delta < film.length:
-                    self.add_error('film', 'Your session time is incorrect ')
-                if price <= 0:
-                    self.add_error('price', 'Enter a correct price!')
-                if FilmSession.objects.filter(~((q3 & q4) | q5), ~Q(id=self.instance.pk), hall=hall).exists():
-                    self.add_error('hall', 'This time in that hall is booked, please choose another hall or time')
-                if start >= end:
-                    self.add_error('start', 'Something is wrong with your session')
-                if start.date() < film.start_premier:
-                    self.add_error('start', 'The start of session does not consist with premier')
-                if end.date() > film.end_premier:
-                    self.add_error('end', 'The end of session does not consist with premier')
+        if start is None:
+            self.add_error('start', 'incorrect date')
+        elif end is None:
+            self.add_error('end', 'Incorrect date')
+        elif None not in (film, hall, price):
+            add_errors(self, session_errors(film, hall, start, end, price, self.instance.pk))
 
 
 class AddPurchaseForm(ModelForm):
@@ -110,25 +69,14 @@ class AddPurchaseForm(ModelForm):
 
     def __init__(self, *args, **kwargs):
         self.request = kwargs.pop('request', None)
+        self.film_session = kwargs.pop('film_session', None)
         super(AddPurchaseForm, self).__init__(*args, **kwargs)
 
     def clean(self):
         cleaned_data = super().clean()
         count = cleaned_data.get('count')
-        session_id = self.request.POST.get('filmSession')
-        film_session = FilmSession.objects.get(id=session_id)
-        user_ = self.request.user
-        sum_ = count * film_session.price
-        now = datetime.datetime.now()
-        now_loc = pytz.utc.localize(now)
-        if film_session.start < now_loc:
-            self.add_error('count', 'You can not buy ticket for this session because this one has already started')
-        if count > film_session.hall_size:
-            self.add_error('count', 'Sorry, not enough tickets')
-        if sum_ > user_.wallet:
-            self.add_error('count', 'money money fucking money')
-        if count <= 0:
-            self.add_error('count', 'Please select one or more tickets')
+        if count is not None:
+            add_errors(self, purchase_errors(self.request.user, self.film_session, count))
 
 
 class FilterForm(forms.Form):
@@ -0,0 +1,57 @@
+import datetime
+import functools
+import hashlib
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.response import Response
+from cinapp.models import IdempotencyKey
+
+
+def fingerprint(request):
+    digest = hashlib.sha256(request.method.encode())
+    digest.update(request.path.encode())
+    digest.update(request.body)
+    return digest.hexdigest()
+
+
+def idempotent(view):
+    # For POSTs carrying an Idempotency-Key, the key row is inserted in the same transaction
+    # as the purchase. A concurrent duplicate blocks on the unique index until the first
+    # request commits and then replays its response; if the first one fails, nothing was
+    # stored and the duplicate runs as a fresh request. Only committed responses are kept.
+    @functools.wraps(view)
+    def wrapper(self, request, *args, **kwargs):
+        key = request.headers.get('Idempotency-Key')
+        if not key or request.method != 'POST':
+            return view(self, request, *args, **kwargs)
+        if len(key) > 255:
+            return Response({'detail': 'Idempotency-Key is too long'}, status=status.HTTP_400_BAD_REQUEST)
+        current = fingerprint(request)
+        with transaction.atomic():
+            record, created = IdempotencyKey.objects.select_for_update().get_or_create(
+                user=request.user, key=key, defaults={'fingerprint': current})
+            if not created and record.created_at < timezone.now() - datetime.timedelta(
+                    seconds=settings.IDEMPOTENCY_KEY_TTL):
+                # Expired but not purged yet: the key starts over.
+                record.fingerprint, record.created_at, created = current, timezone.now(), True
+            if not created:
+                if record.fingerprint != current:
+                    return Response({'detail': 'This Idempotency-Key was used for a different request'},
+                                    status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+                return Response(record.response, status=record.status_code, headers={'Idempotent-Replayed': 'true'})
+            response = view(self, request, *args, **kwargs)
+            record.status_code, record.response = response.status_code, response.data
+            record.save()
+        return response
+    return wrapper
+
+
+def purge_expired(batch_size=10000):
+    cutoff = timezone.now() - datetime.timedelta(seconds=settings.IDEMPOTENCY_KEY_TTL)
+    ids = list(IdempotencyKey.objects.filter(created_at__lt=cutoff).order_by('created_at').values_list(
+        'id', flat=True)[:batch_size])
+    IdempotencyKey.objects.filter(id__in=ids).delete()
+    return len(ids)
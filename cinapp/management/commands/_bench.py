@@ -0,0 +1,70 @@
+import datetime
+import threading
+import time
+import uuid
+
+from django.db import connection
+from django.utils import timezone
+from cinapp.models import MyUser, Hall, Film, FilmSession
+
+BENCH_PREFIX = 'bench-'
+
+
+def make_hall(size):
+    return Hall.objects.create(name=BENCH_PREFIX + uuid.uuid4().hex[:8], size=size)
+
+
+def make_film(first_day, last_day):
+    return Film.objects.create(name=BENCH_PREFIX + uuid.uuid4().hex[:8], start_premier=first_day,
+                               end_premier=last_day, length=datetime.timedelta(hours=2))
+
+
+def make_session(size, price=100, start=None):
+    start = start or timezone.now() + datetime.timedelta(days=1)
+    today = start.date()
+    hall = make_hall(size)
+    film = make_film(today - datetime.timedelta(days=1), today + datetime.timedelta(days=30))
+    return FilmSession.objects.create(film=film, hall=hall, start=start, end=start + datetime.timedelta(hours=2),
+                                      price=price, hall_size=size)
+
+
+def make_users(count, wallet=1000):
+    tag = BENCH_PREFIX + uuid.uuid4().hex[:8]
+    MyUser.objects.bulk_create([MyUser(username='%s-%s' % (tag, i), wallet=wallet) for i in range(count)])
+    return list(MyUser.objects.filter(username__startswith=tag).order_by('id'))
+
+
+def cleanup():
+    FilmSession.objects.filter(hall__name__startswith=BENCH_PREFIX).purge()
+    Hall.objects.filter(name__startswith=BENCH_PREFIX).delete()
+    Film.objects.filter(name__startswith=BENCH_PREFIX).delete()
+    MyUser.objects.filter(username__startswith=BENCH_PREFIX).delete()
+
+
+def run_parallel(func, jobs, threads):
+    # Exceptions raised by func are collected as results, not re-raised.
+    chunks = [jobs[i::threads] for i in range(threads)]
+    results = []
+    lock = threading.Lock()
+    barrier = threading.Barrier(threads + 1)
+
+    def worker(chunk):
+        barrier.wait()
+        local = []
+        for job in chunk:
+            try:
+                local.append(func(job))
+            except Exception as e:
+                local.append(e)
+        connection.close()
+        with lock:
+            results.extend(local)
+
+    workers = [threading.Thread(target=worker, args=(chunk,)) for chunk in chunks]
+    for w in workers:
+        w.start()
+    barrier.wait()
+    started = time.perf_counter()
+    for w in workers:
+        w.join()
+    return time.perf_counter() - started, results
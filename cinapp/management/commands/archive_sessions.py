@@ -0,0 +1,27 @@
+import time
+
+from django.core.management.base import BaseCommand
+from cinapp.archive import archive_ended
+
+
+class Command(BaseCommand):
+    help = 'Moves sessions that ended ARCHIVE_AFTER_DAYS ago, with their purchases, to the archive tables'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--interval', type=float, default=0,
+                            help='Keep running and archive every INTERVAL seconds; by default archive once and exit')
+
+    def handle(self, *args, **options):
+        while True:
+            archived = 0
+            while True:
+                batch = archive_ended(options['batch_size'])
+                archived += batch
+                if batch < options['batch_size']:
+                    break
+            if archived or not options['interval']:
+                self.stdout.write('Archived %d sessions' % archived)
+            if not options['interval']:
+                return
+            time.sleep(options['interval'])
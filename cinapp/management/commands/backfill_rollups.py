@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Max, Min
+from django.utils import timezone
+from cinapp.exports import parse_day
+from cinapp.models import FilmSession, ArchivedFilmSession
+from cinapp.reports import refresh_capacity, refresh_sales
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds box-office rollups from live and archived sessions and purchases'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--from', dest='date_from', type=parse_day, help='YYYY-MM-DD, defaults to the first session')
+        parser.add_argument('--to', dest='date_to', type=parse_day, help='YYYY-MM-DD, defaults to the last session')
+        parser.add_argument('--capacity-only', action='store_true',
+                            help='Only recompute seats on offer; safe to run periodically while sales go on')
+
+    def handle(self, *args, **options):
+        bounds = [model.objects.aggregate(first=Min('start'), last=Max('start'))
+                  for model in (FilmSession, ArchivedFilmSession)]
+        starts = [bound[edge] for bound in bounds for edge in ('first', 'last') if bound[edge] is not None]
+        if not starts:
+            self.stdout.write('There are no sessions')
+            return
+        day_from = options['date_from'] or timezone.localtime(min(starts)).date()
+        day_to = options['date_to'] or timezone.localtime(max(starts)).date()
+        refresh_capacity(day_from, day_to)
+        if not options['capacity_only']:
+            refresh_sales(day_from, day_to)
+        self.stdout.write('Rollups rebuilt for %s - %s' % (day_from, day_to))
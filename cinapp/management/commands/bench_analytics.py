@@ -0,0 +1,56 @@
+import datetime
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.utils import timezone
+from cinapp.analytics import sales_analytics
+from cinapp.models import Film, FilmSession, Purchase
+from ._bench import make_hall, make_film, make_users, cleanup
+
+
+class Command(BaseCommand):
+    help = 'Time of the occupancy/fill-rate/elasticity analytics over a year of synthetic purchases'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sessions', type=int, default=20000)
+        parser.add_argument('--purchases', type=int, default=1000000)
+
+    def handle(self, *args, **options):
+        today = timezone.now().date()
+        first_day = today - datetime.timedelta(days=365)
+        start = timezone.now() - datetime.timedelta(days=365)
+        try:
+            films = [make_film(first_day, today) for _ in Film.CHOICE_GENRE]
+            for film, (genre, _) in zip(films, Film.CHOICE_GENRE):
+                film.genre = genre
+                film.save()
+            halls = [make_hall(100) for _ in range(8)]
+            user = make_users(1)[0]
+            per_hall = options['sessions'] // len(halls)
+            FilmSession.objects.bulk_create(
+                [FilmSession(film=films[(i + j) % len(films)], hall=hall,
+                             start=start + datetime.timedelta(hours=3 * i + j % 3),
+                             end=start + datetime.timedelta(hours=3 * i + j % 3 + 2),
+                             price=50 + (i * 7 + j) % 20 * 10, hall_size=100)
+                 for j, hall in enumerate(halls) for i in range(per_hall)], batch_size=5000)
+            ids = list(FilmSession.objects.filter(hall__in=halls).values_list('id', flat=True))
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    'INSERT INTO cinapp_purchase (film_session_id, user_id, count, seats, created_at) '
+                    'SELECT s.id, %s, 1 + n %% 3, \'[]\', s.start - (n %% 200) * interval \'1 hour\' '
+                    'FROM generate_series(1, %s) n JOIN cinapp_filmsession s ON s.id = (%s::int[])[1 + n %% %s]',
+                    [user.id, options['purchases'], ids, len(ids)])
+                cursor.execute('ANALYZE cinapp_purchase')
+            started = time.perf_counter()
+            result = sales_analytics(first_day, today)
+            elapsed = time.perf_counter() - started
+            self.stdout.write('%d sessions, %d purchases: %.2f s' % (len(ids), options['purchases'], elapsed))
+            for point in result['occupancy_curve']:
+                self.stdout.write('%4dh before start: %.1f%% free' % (point['hours_before_start'],
+                                                                     point['remaining'] * 100))
+            for row in result['price_elasticity']:
+                self.stdout.write('%-10s elasticity %s' % (row['genre'], row['elasticity']))
+        finally:
+            Purchase.objects.filter(film_session__hall__name__startswith='bench-')._raw_delete('default')
+            cleanup()
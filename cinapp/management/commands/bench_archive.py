@@ -0,0 +1,102 @@
+import datetime
+import statistics
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client
+from django.utils import timezone
+from cinapp.archive import archive_ended
+from cinapp.caching import session_listing
+from cinapp.models import MyUser, CustomToken, FilmSession, Purchase, ArchivedFilmSession, ArchivedPurchase
+from ._bench import make_hall, make_film, make_users, cleanup
+
+HALLS = 100
+
+SESSIONS_SQL = '''
+    INSERT INTO cinapp_filmsession (film_id, hall_id, start, "end", price, hall_size, seats)
+    SELECT %(film)s, (%(halls)s::int[])[1 + g %% {halls}], %(base)s + (g / {halls}) * %(step)s * interval '3 hours',
+           %(base)s + (g / {halls}) * %(step)s * interval '3 hours' + interval '2 hours', 100 + g %% 50, 99, ''
+    FROM generate_series(0, %(count)s - 1) AS g
+'''.format(halls=HALLS)
+
+PURCHASES_SQL = '''
+    INSERT INTO cinapp_purchase (film_session_id, user_id, count, seats, created_at)
+    SELECT id, %(user)s, 1, '[0]', start - interval '1 day' FROM cinapp_filmsession
+    WHERE hall_id = ANY(%(halls)s)
+'''
+
+URLS = ('/?period=1', '/?period=1&ordering=1', '/purchase/', '/api/purchase/', '/api/session/')
+
+
+class Command(BaseCommand):
+    help = 'List latency with all history in the live tables, then after archive_sessions moved it out'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--history', type=int, default=1000000, help='Sessions that ended long ago')
+        parser.add_argument('--current', type=int, default=5000, help='Sessions around today')
+        parser.add_argument('--requests', type=int, default=50)
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        now = timezone.now().replace(minute=0, second=0, microsecond=0)
+        old = now - datetime.timedelta(days=settings.ARCHIVE_AFTER_DAYS + 1)
+        halls = []
+        try:
+            halls = [make_hall(100).id for _ in range(HALLS)]
+            film = make_film(old.date(), now.date())
+            admin = make_users(1)[0]
+            MyUser.objects.filter(id=admin.id).update(is_superuser=True, is_staff=True)
+            started = time.perf_counter()
+            with connection.cursor() as cursor:
+                cursor.execute(SESSIONS_SQL, {'film': film.id, 'halls': halls, 'base': old, 'step': -1,
+                                              'count': options['history']})
+                cursor.execute(SESSIONS_SQL, {'film': film.id, 'halls': halls, 'base': now - datetime.timedelta(days=2),
+                                              'step': 1, 'count': options['current']})
+                # Without statistics the foreign key checks of the purchase insert would scan the sessions.
+                cursor.execute('ANALYZE cinapp_filmsession')
+                cursor.execute(PURCHASES_SQL, {'user': admin.id, 'halls': halls})
+                cursor.execute('ANALYZE cinapp_purchase')
+            self.stdout.write('%d history + %d current sessions with one purchase each, loaded in %.1f s' % (
+                options['history'], options['current'], time.perf_counter() - started))
+
+            token = CustomToken.objects.create(user=admin).key
+            self.report('all history live', admin, token, options['requests'])
+            started = time.perf_counter()
+            archived = 0
+            while True:
+                batch = archive_ended(options['batch_size'])
+                archived += batch
+                if batch < options['batch_size']:
+                    break
+            elapsed = time.perf_counter() - started
+            self.stdout.write('archive_sessions: %d sessions in %.1f s, %.0f sessions/s' % (
+                archived, elapsed, archived / elapsed))
+            with connection.cursor() as cursor:
+                cursor.execute('VACUUM ANALYZE cinapp_filmsession, cinapp_purchase')
+            self.report('history archived', admin, token, options['requests'])
+        finally:
+            ArchivedPurchase.objects.filter(film_session__hall_id__in=halls)._raw_delete('default')
+            ArchivedFilmSession.objects.filter(hall_id__in=halls)._raw_delete('default')
+            Purchase.objects.filter(film_session__hall_id__in=halls)._raw_delete('default')
+            FilmSession.objects.filter(hall_id__in=halls)._raw_delete('default')
+            cleanup()
+
+    def report(self, label, admin, token, requests):
+        self.stdout.write('%s: %d live sessions, %d live purchases' % (
+            label, FilmSession.objects.count(), Purchase.objects.count()))
+        session_listing.enabled = False
+        client = Client()
+        client.force_login(admin)
+        try:
+            for url in URLS:
+                client.get(url, HTTP_AUTHORIZATION='Token ' + token)
+                latencies = []
+                for _ in range(requests):
+                    started = time.perf_counter()
+                    client.get(url, HTTP_AUTHORIZATION='Token ' + token)
+                    latencies.append(time.perf_counter() - started)
+                self.stdout.write('  %-24s p50 %7.2f ms' % (url, statistics.median(latencies) * 1000))
+        finally:
+            session_listing.enabled = True
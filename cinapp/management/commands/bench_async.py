@@ -0,0 +1,86 @@
+import http.client
+import json
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from cinapp.models import CustomToken
+from ._bench import make_session, make_users, cleanup, run_parallel
+
+SERVERS = {
+    'wsgi': ('/api/purchase/', [sys.executable, str(settings.BASE_DIR / 'manage.py'), 'runserver', '--noreload',
+                                '127.0.0.1:%(port)s']),
+    'asgi': ('/api/async/purchase/', [sys.executable, '-m', 'uvicorn', 'Cinema.asgi:application',
+                                      '--port', '%(port)s', '--log-level', 'warning']),
+}
+
+
+def wait_for_port(port, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), 0.5).close()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError('Server on port %s did not start' % port)
+
+
+class Command(BaseCommand):
+    help = 'Purchase throughput and latency over HTTP: threaded WSGI runserver vs one uvicorn process'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=2000)
+        parser.add_argument('--concurrency', type=int, default=64)
+        parser.add_argument('--sessions', type=int, default=8)
+        parser.add_argument('--port', type=int, default=8765)
+        parser.add_argument('--servers', default='wsgi,asgi')
+
+    def handle(self, *args, **options):
+        self.stdout.write('server  purchases/s    p50 ms    p99 ms  sold  rejected')
+        for name in options['servers'].split(','):
+            path, command = SERVERS[name]
+            port = options['port']
+            try:
+                seats = options['requests'] // options['sessions'] + 1
+                sessions = [make_session(seats) for _ in range(options['sessions'])]
+                users = make_users(options['requests'], wallet=10 ** 6)
+                tokens = [CustomToken.objects.create(user=user) for user in users]
+                jobs = [(token.key, sessions[i % len(sessions)].id) for i, token in enumerate(tokens)]
+                server = subprocess.Popen([part % {'port': port} for part in command],
+                                          stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+                try:
+                    wait_for_port(port)
+                    elapsed, results = self.load(port, path, jobs, options['concurrency'])
+                finally:
+                    server.terminate()
+                    server.wait()
+                latencies = sorted(latency for status, latency in results if status == 201)
+                sold = len(latencies)
+                self.stdout.write('%6s  %11.1f  %8.1f  %8.1f  %4d  %8d' % (
+                    name, sold / elapsed, latencies[sold // 2] * 1000 if sold else 0,
+                    latencies[int(sold * 0.99)] * 1000 if sold else 0, sold, len(results) - sold))
+            finally:
+                cleanup()
+
+    def load(self, port, path, jobs, concurrency):
+        local = threading.local()
+
+        def buy(job):
+            key, session_id = job
+            if not hasattr(local, 'connection'):
+                local.connection = http.client.HTTPConnection('127.0.0.1', port)
+            body = json.dumps({'film_session': session_id, 'count': 1})
+            started = time.perf_counter()
+            local.connection.request('POST', path, body, {'Authorization': 'Token ' + key,
+                                                           'Content-Type': 'application/json'})
+            response = local.connection.getresponse()
+            response.read()
+            return response.status, time.perf_counter() - started
+
+        elapsed, results = run_parallel(buy, jobs, concurrency)
+        return elapsed, [result for result in results if isinstance(result, tuple)]
@@ -0,0 +1,38 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import CaptureQueriesContext, override_settings
+from rest_framework.test import APIClient
+from cinapp.API.authentications import token_cache
+from cinapp.models import CustomToken
+from ._bench import make_users, cleanup
+
+
+class Command(BaseCommand):
+    help = 'Authenticated API requests/sec and token writes per request'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=1000)
+        parser.add_argument('--url', default='/api/hall/')
+
+    def handle(self, *args, **options):
+        try:
+            token = CustomToken.objects.create(user=make_users(1)[0])
+            client = APIClient()
+            client.credentials(HTTP_AUTHORIZATION='Token ' + token.key)
+            for granularity in (0, 30):
+                with override_settings(TOKEN_TOUCH_GRANULARITY=granularity):
+                    client.get(options['url'])
+                    with CaptureQueriesContext(connection) as queries:
+                        started = time.perf_counter()
+                        for _ in range(options['requests']):
+                            client.get(options['url'])
+                        elapsed = time.perf_counter() - started
+                writes = sum(1 for q in queries if q['sql'].startswith('UPDATE "cinapp_customtoken"'))
+                self.stdout.write('granularity %3ds: %8.1f req/s  %.3f token writes/request  %.2f queries/request' % (
+                    granularity, options['requests'] / elapsed, writes / options['requests'],
+                    len(queries) / options['requests']))
+            self.stdout.write('token cache: %s' % token_cache.stats())
+        finally:
+            cleanup()
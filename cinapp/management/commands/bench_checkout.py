@@ -0,0 +1,50 @@
+import datetime
+
+from django.core.management.base import BaseCommand
+from django.db.models import Sum
+from django.utils import timezone
+from cinapp.models import FilmSession, MyUser
+from cinapp.reservations import checkout_cart, reserve_seats
+from ._bench import make_session, make_users, cleanup, run_parallel
+
+
+class Command(BaseCommand):
+    help = 'Carts/sec of one checkout per cart vs one single purchase per cart line'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--carts', type=int, default=400)
+        parser.add_argument('--lines', type=int, default=3)
+        parser.add_argument('--sessions', type=int, default=6)
+        parser.add_argument('--threads', default='1,8')
+
+    def handle(self, *args, **options):
+        self.stdout.write('mode        threads  carts/s  done  rejected  consistent')
+        for threads in [int(t) for t in options['threads'].split(',')]:
+            for mode in ('sequential', 'checkout'):
+                try:
+                    now = timezone.now()
+                    sessions = [make_session(options['carts'] * 2, start=now + datetime.timedelta(days=1, hours=3 * i))
+                                for i in range(options['sessions'])]
+                    users = make_users(options['carts'], wallet=10 ** 6)
+                    carts = [(user, [sessions[(i + j) % len(sessions)] for j in range(options['lines'])])
+                             for i, user in enumerate(users)]
+
+                    def buy(cart):
+                        user, cart_sessions = cart
+                        if mode == 'checkout':
+                            return checkout_cart(user, [{'film_session': s.id, 'count': 2} for s in cart_sessions])
+                        return [reserve_seats(user, s, 2) for s in cart_sessions]
+
+                    elapsed, results = run_parallel(buy, carts, threads)
+                    done = sum(1 for r in results if isinstance(r, list))
+                    sold = FilmSession.objects.filter(id__in=[s.id for s in sessions]).aggregate(
+                        left=Sum('hall_size'))['left']
+                    spent = MyUser.objects.filter(id__in=[u.id for u in users]).aggregate(
+                        spent=Sum('total_spent'))['spent']
+                    expected = done * options['lines'] * 2
+                    consistent = (len(sessions) * options['carts'] * 2 - sold == expected
+                                  and spent == expected * 100)
+                    self.stdout.write('%-10s  %7d  %7.1f  %4d  %8d  %10s' % (
+                        mode, threads, done / elapsed, done, len(results) - done, consistent))
+                finally:
+                    cleanup()
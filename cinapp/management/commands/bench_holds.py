@@ -0,0 +1,59 @@
+import datetime
+import time
+
+from django.core.management.base import BaseCommand
+from django.db.models import Sum
+from django.utils import timezone
+from cinapp.models import FilmSession, SeatHold
+from cinapp.reservations import release_expired
+from cinapp.seatmap import SeatMap
+from ._bench import make_session, make_users, cleanup
+
+
+class Command(BaseCommand):
+    help = 'Sweep throughput of expired holds among many live ones; checks seat maps are restored'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--holds', type=int, default=200000)
+        parser.add_argument('--expired', type=int, default=20000)
+        parser.add_argument('--seats', type=int, default=1000)
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        seats = options['seats']
+        now = timezone.now()
+        try:
+            user = make_users(1)[0]
+            sessions = [make_session(seats, start=now + datetime.timedelta(days=1, hours=3 * i))
+                        for i in range(-(-options['holds'] // seats))]
+            holds = []
+            for i in range(options['holds']):
+                expires = now + datetime.timedelta(minutes=-1 if i % (options['holds'] // options['expired']) == 0
+                                                   else 10)
+                holds.append(SeatHold(film_session=sessions[i // seats], user=user, count=1, seats=[i % seats],
+                                      expires_at=expires))
+            SeatHold.objects.bulk_create(holds, batch_size=5000)
+            for film_session in sessions:
+                held = SeatHold.objects.filter(film_session=film_session).values_list('seats', flat=True)
+                seat_map = SeatMap(seats, 10)
+                seat_map.book([seat for row in held for seat in row])
+                FilmSession.objects.filter(id=film_session.id).update(hall_size=seat_map.free_count,
+                                                                      seats=seat_map.to_bytes())
+            expired = SeatHold.objects.filter(expires_at__lte=timezone.now()).count()
+            self.stdout.write(SeatHold.objects.filter(expires_at__lte=timezone.now()).order_by(
+                'expires_at', 'id')[:options['batch_size']].explain())
+            batches = []
+            while True:
+                started = time.perf_counter()
+                released = release_expired(options['batch_size'])
+                batches.append(time.perf_counter() - started)
+                if released < options['batch_size']:
+                    break
+            total = sum(batches)
+            left = FilmSession.objects.filter(id__in=[s.id for s in sessions]).aggregate(free=Sum('hall_size'))['free']
+            consistent = left == len(sessions) * seats - SeatHold.objects.count()
+            self.stdout.write('%d holds, %d expired: %.2f s, %.0f holds/s, worst batch %.1f ms, seat maps %s' % (
+                len(holds), expired, total, expired / total, max(batches) * 1000,
+                'consistent' if consistent else 'INCONSISTENT'))
+        finally:
+            cleanup()
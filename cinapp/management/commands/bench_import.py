@@ -0,0 +1,35 @@
+import datetime
+import time
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from cinapp.schedule import import_sessions
+from ._bench import make_hall, make_film, cleanup
+
+
+class Command(BaseCommand):
+    help = 'Times a bulk schedule import of one multiplex week'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--halls', type=int, default=25)
+        parser.add_argument('--days', type=int, default=7)
+
+    def handle(self, *args, **options):
+        first = timezone.now().replace(hour=0, minute=0, second=0, microsecond=0) + datetime.timedelta(days=1)
+        slot = datetime.timedelta(minutes=135)
+        per_day = int(datetime.timedelta(days=1) / slot)
+        try:
+            film = make_film(first.date(), first.date() + datetime.timedelta(days=options['days'] + 1))
+            halls = [make_hall(100) for _ in range(options['halls'])]
+            rows = []
+            for hall in halls:
+                for i in range(per_day * options['days']):
+                    start = first + slot * i
+                    rows.append({'film': film.id, 'hall': hall.id, 'start': start.isoformat(),
+                                 'end': (start + datetime.timedelta(hours=2)).isoformat(), 'price': '120.00'})
+            started = time.perf_counter()
+            created, errors = import_sessions(rows)
+            elapsed = time.perf_counter() - started
+            self.stdout.write('%d rows: %d created, %d errors in %.2fs' % (len(rows), created, len(errors), elapsed))
+        finally:
+            cleanup()
@@ -0,0 +1,46 @@
+import datetime
+import time
+
+from django.core.management.base import BaseCommand
+from django.test import Client
+from django.utils import timezone
+from cinapp.caching import session_listing
+from cinapp.models import FilmSession
+from ._bench import make_hall, make_film, cleanup
+
+
+class Command(BaseCommand):
+    help = 'Requests/sec of the session listings with and without the listing cache'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sessions', type=int, default=2000)
+        parser.add_argument('--requests', type=int, default=300)
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+        urls = ['/?period=1&ordering=1', '/?period=2&ordering=2', '/?period=1&page=3',
+                '/api/session/', '/api/session/?hall=%s']
+        try:
+            film = make_film(now.date() - datetime.timedelta(days=1), now.date() + datetime.timedelta(days=365))
+            hall = make_hall(100)
+            FilmSession.objects.bulk_create(
+                [FilmSession(film=film, hall=hall, start=now + datetime.timedelta(hours=3 * i),
+                             end=now + datetime.timedelta(hours=3 * i + 2), price=100 + i % 50, hall_size=100)
+                 for i in range(options['sessions'])])
+            session_listing.invalidate()
+            client = Client()
+            for url in urls:
+                url = url.replace('%s', hall.name)
+                rates = []
+                for enabled in (False, True):
+                    session_listing.enabled = enabled
+                    client.get(url)
+                    started = time.perf_counter()
+                    for _ in range(options['requests']):
+                        client.get(url)
+                    rates.append(options['requests'] / (time.perf_counter() - started))
+                self.stdout.write('%-32s %8.1f req/s uncached %8.1f req/s cached' % (url, rates[0], rates[1]))
+            self.stdout.write(str(session_listing.stats()))
+        finally:
+            session_listing.enabled = True
+            cleanup()
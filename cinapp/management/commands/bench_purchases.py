@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Sum
+from cinapp.models import MyUser, FilmSession, Purchase
+from cinapp.reservations import reserve_seats
+from ._bench import make_session, make_users, cleanup, run_parallel
+
+
+class Command(BaseCommand):
+    help = 'Concurrent purchase load against one session; reports purchases/sec and oversells'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seats', type=int, default=500)
+        parser.add_argument('--buyers', type=int, default=1000)
+        parser.add_argument('--threads', default='1,4,16,32')
+
+    def handle(self, *args, **options):
+        seats = options['seats']
+        buyers = options['buyers']
+        self.stdout.write('threads  purchases/s  sold  rejected  oversold')
+        for threads in [int(t) for t in options['threads'].split(',')]:
+            try:
+                film_session = make_session(seats)
+                users = make_users(buyers)
+
+                def buy(user):
+                    return reserve_seats(user, film_session, 1)
+
+                elapsed, results = run_parallel(buy, users, threads)
+                sold = sum(1 for r in results if isinstance(r, Purchase))
+                stored = Purchase.objects.filter(film_session=film_session).aggregate(s=Sum('count'))['s'] or 0
+                left = FilmSession.objects.get(id=film_session.id).hall_size
+                oversold = max(stored - seats, 0) + (stored + left != seats)
+                broken_wallets = MyUser.objects.filter(id__in=[u.id for u in users], wallet__lt=0).count()
+                self.stdout.write('%7d  %11.1f  %4d  %8d  %8d' % (threads, sold / elapsed, sold,
+                                                                  len(results) - sold, oversold + broken_wallets))
+            finally:
+                cleanup()
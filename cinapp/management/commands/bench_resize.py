@@ -0,0 +1,73 @@
+import datetime
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.db.models import Sum
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from cinapp.models import FilmSession, Purchase, SeatHold
+from cinapp.reservations import resize_hall
+from ._bench import make_hall, make_film, make_users, cleanup
+
+
+class Command(BaseCommand):
+    help = 'Resizes a hall with many sessions: remaining seats of upcoming ones are recomputed, past ones untouched'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sessions', type=int, default=50000)
+        parser.add_argument('--past', type=int, default=5000)
+        parser.add_argument('--size', type=int, default=200)
+
+    def handle(self, *args, **options):
+        size = options['size']
+        now = timezone.now().replace(microsecond=0)
+        first = now - datetime.timedelta(hours=3 * options['past'])
+        try:
+            user = make_users(1)[0]
+            hall = make_hall(size)
+            film = make_film(first.date(), first.date() + datetime.timedelta(days=options['sessions']))
+            FilmSession.objects.bulk_create(
+                [FilmSession(film=film, hall=hall, start=first + datetime.timedelta(hours=3 * i + 1),
+                             end=first + datetime.timedelta(hours=3 * i + 3), price=100, hall_size=size)
+                 for i in range(options['sessions'])], batch_size=5000)
+            sessions = list(FilmSession.objects.filter(hall=hall).order_by('id').values_list('id', flat=True))
+            Purchase.objects.bulk_create(
+                [Purchase(film_session_id=session_id, user=user, count=1 + n % 5)
+                 for n, session_id in enumerate(sessions) if n % 2 == 0], batch_size=5000)
+            SeatHold.objects.bulk_create(
+                [SeatHold(film_session_id=session_id, user=user, count=2, expires_at=now + datetime.timedelta(hours=1))
+                 for n, session_id in enumerate(sessions) if n % 7 == 0], batch_size=5000)
+            self.stdout.write('%d sessions (%d past), %d purchases, %d holds' % (
+                len(sessions), options['past'], Purchase.objects.filter(film_session__hall=hall).count(),
+                SeatHold.objects.filter(film_session__hall=hall).count()))
+            FilmSession.objects.filter(hall=hall, start__gt=now).update(hall_size=-1)
+            with connection.cursor() as cursor:
+                # Fresh bulk inserts have no statistics yet; autovacuum would have them on a live database.
+                cursor.execute('ANALYZE cinapp_filmsession, cinapp_purchase, cinapp_seathold')
+            past_before = FilmSession.objects.filter(hall=hall, start__lte=now).aggregate(total=Sum('hall_size'))
+
+            hall.size = size + 50
+            hall.save()
+            with CaptureQueriesContext(connection) as queries:
+                started = time.perf_counter()
+                resized = resize_hall(hall)
+                elapsed = time.perf_counter() - started
+            update = next(float(q['time']) for q in queries if q['sql'].startswith('UPDATE'))
+            self.stdout.write('resize_hall: %d upcoming sessions in %.3f s (UPDATE %.3f s), %d queries' % (
+                resized, elapsed, update, len(queries)))
+
+            upcoming = FilmSession.objects.filter(hall=hall, start__gt=now)
+            expected = sum(hall.size - (1 + n % 5 if n % 2 == 0 else 0) - (2 if n % 7 == 0 else 0)
+                           for n in range(options['past'], len(sessions)))
+            correct = upcoming.aggregate(total=Sum('hall_size'))['total'] == expected and \
+                FilmSession.objects.filter(hall=hall, start__lte=now).aggregate(total=Sum('hall_size')) == past_before
+            self.stdout.write('remaining seats %s' % ('correct' if correct else 'WRONG'))
+
+            started = time.perf_counter()
+            FilmSession.objects.filter(hall=hall).update(hall_size=hall.size)
+            self.stdout.write('old reset of every session to the hall size: %.3f s' % (time.perf_counter() - started))
+        finally:
+            Purchase.objects.filter(film_session__hall__name__startswith='bench-')._raw_delete('default')
+            SeatHold.objects.filter(film_session__hall__name__startswith='bench-')._raw_delete('default')
+            cleanup()
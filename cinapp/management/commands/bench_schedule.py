@@ -0,0 +1,57 @@
+import datetime
+import random
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.db.models import Q
+from django.utils import timezone
+from cinapp.models import FilmSession
+from ._bench import make_hall, make_film, cleanup
+
+
+class Command(BaseCommand):
+    help = 'Hall overlap checks against a large session history: legacy filter vs the interval index'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sessions', type=int, default=100000)
+        parser.add_argument('--halls', type=int, default=20)
+        parser.add_argument('--checks', type=int, default=500)
+
+    def legacy(self, hall, start, end):
+        q1 = Q(start__gt=start)
+        q2 = Q(start__gte=end)
+        q3 = Q(end__lte=start)
+        return FilmSession.objects.filter(~((q1 & q2) | q3), hall=hall).exists()
+
+    def indexed(self, hall, start, end):
+        return FilmSession.objects.overlapping(hall, start, end).exists()
+
+    def handle(self, *args, **options):
+        per_hall = options['sessions'] // options['halls']
+        slot = datetime.timedelta(hours=3)
+        now = timezone.now().replace(minute=0, second=0, microsecond=0)
+        first = now - slot * per_hall
+        try:
+            film = make_film(first.date(), now.date())
+            halls = [make_hall(100) for _ in range(options['halls'])]
+            for hall in halls:
+                FilmSession.objects.bulk_create(
+                    [FilmSession(film=film, hall=hall, start=first + slot * i,
+                                 end=first + slot * i + datetime.timedelta(hours=2), price=100, hall_size=100)
+                     for i in range(per_hall)], batch_size=5000)
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE cinapp_filmsession')
+            probes = []
+            for _ in range(options['checks']):
+                start = first + datetime.timedelta(minutes=random.randrange(per_hall * 180))
+                probes.append((random.choice(halls), start, start + datetime.timedelta(hours=2)))
+            for name, check in (('legacy filter', self.legacy), ('interval index', self.indexed)):
+                started = time.perf_counter()
+                booked = sum(check(*probe) for probe in probes)
+                elapsed = time.perf_counter() - started
+                self.stdout.write('%-15s %8.3f ms/check  %d booked' % (name, elapsed * 1000 / len(probes), booked))
+            hall, start, end = probes[0]
+            self.stdout.write(FilmSession.objects.overlapping(hall, start, end).explain())
+        finally:
+            cleanup()
@@ -0,0 +1,70 @@
+import datetime
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client
+from django.utils import timezone
+from cinapp.models import FilmSession, ScheduleSnapshot
+from cinapp.pagination import after
+from cinapp.snapshots import build_snapshot, schedule_page
+from ._bench import make_hall, make_film, cleanup
+
+URLS = ('/?period=3', '/?period=3&ordering=1')
+
+
+class Command(BaseCommand):
+    help = "Tomorrow's listing read from its schedule snapshot against the live sessions query"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--halls', type=int, default=100)
+        parser.add_argument('--days', type=int, default=60, help='Days of sessions around tomorrow')
+        parser.add_argument('--requests', type=int, default=200)
+
+    def handle(self, *args, **options):
+        tomorrow = timezone.localdate() + datetime.timedelta(days=1)
+        first = tomorrow - datetime.timedelta(days=options['days'] // 2)
+        day_start = timezone.make_aware(datetime.datetime.combine(first, datetime.time.min))
+        try:
+            film = make_film(first, first + datetime.timedelta(days=options['days']))
+            for n in range(options['halls']):
+                hall = make_hall(100)
+                FilmSession.objects.bulk_create(
+                    [FilmSession(film=film, hall=hall, start=day_start + datetime.timedelta(hours=3 * i),
+                                 end=day_start + datetime.timedelta(hours=3 * i + 2), price=100 + (n + i) % 50,
+                                 hall_size=100)
+                     for i in range(8 * options['days'])], batch_size=5000)
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE cinapp_filmsession')
+            ScheduleSnapshot.objects.filter(day=tomorrow).delete()
+            self.stdout.write('%d sessions, %d of them tomorrow' % (
+                FilmSession.objects.count(), FilmSession.objects.on_day(tomorrow).count()))
+
+            started = time.perf_counter()
+            build_snapshot(tomorrow)
+            self.stdout.write('snapshot rebuild: %.1f ms' % ((time.perf_counter() - started) * 1000))
+
+            live = FilmSession.objects.select_related('film', 'hall').on_day(tomorrow)
+            for keyset in (('start', 'id'), ('price', 'id')):
+                last = live.order_by(*keyset)[500]
+                values = [getattr(last, field) for field in keyset]
+                self.report('query   %s, page 50' % keyset[0], options['requests'],
+                            lambda: list(live.order_by(*keyset).filter(after(keyset, values))[:11]))
+                self.report('snapshot %s, page 50' % keyset[0], options['requests'],
+                            lambda: schedule_page(tomorrow, keyset, values, 11))
+            client = Client()
+            for url in URLS:
+                self.report('GET %s' % url, options['requests'], lambda: client.get(url))
+        finally:
+            ScheduleSnapshot.objects.filter(day=tomorrow).delete()
+            cleanup()
+
+    def report(self, label, requests, func):
+        func()
+        latencies = []
+        for _ in range(requests):
+            started = time.perf_counter()
+            func()
+            latencies.append(time.perf_counter() - started)
+        self.stdout.write('  %-28s p50 %7.2f ms' % (label, statistics.median(latencies) * 1000))
@@ -0,0 +1,26 @@
+import sys
+
+from django.core.management.base import BaseCommand
+from cinapp.exports import EXPORT_FORMATS, parse_day, purchase_rows
+
+
+class Command(BaseCommand):
+    help = 'Streams all purchases as CSV or NDJSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=sorted(EXPORT_FORMATS), default='csv')
+        parser.add_argument('--from', dest='date_from', type=parse_day, help='YYYY-MM-DD, inclusive')
+        parser.add_argument('--to', dest='date_to', type=parse_day, help='YYYY-MM-DD, inclusive')
+        parser.add_argument('--output', help='File to write instead of stdout')
+        parser.add_argument('--chunk-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        lines, content_type = EXPORT_FORMATS[options['format']]
+        rows = purchase_rows(options['date_from'], options['date_to'], options['chunk_size'])
+        out = open(options['output'], 'w', newline='') if options['output'] else sys.stdout
+        try:
+            for line in lines(rows):
+                out.write(line)
+        finally:
+            if options['output']:
+                out.close()
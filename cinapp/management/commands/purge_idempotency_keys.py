@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+from cinapp.idempotency import purge_expired
+
+
+class Command(BaseCommand):
+    help = 'Deletes stored Idempotency-Key responses older than IDEMPOTENCY_KEY_TTL'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=10000)
+
+    def handle(self, *args, **options):
+        purged = 0
+        while True:
+            batch = purge_expired(options['batch_size'])
+            purged += batch
+            if batch < options['batch_size']:
+                break
+        self.stdout.write('Purged %d keys' % purged)
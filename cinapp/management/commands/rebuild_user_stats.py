@@ -0,0 +1,55 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import DecimalField, ExpressionWrapper, F, IntegerField, Max, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Coalesce, Greatest
+from cinapp.models import MyUser, Purchase, ArchivedPurchase
+
+MONEY = DecimalField(max_digits=14, decimal_places=2)
+
+
+def user_totals(model):
+    purchases = model.objects.filter(user=OuterRef('pk')).order_by().values('user')
+    return {
+        'spent': Coalesce(Subquery(purchases.annotate(s=Sum(F('count') * F('film_session__price'))).values('s')),
+                          Value(0), output_field=MONEY),
+        'tickets': Coalesce(Subquery(purchases.annotate(s=Sum('count')).values('s')), Value(0),
+                            output_field=IntegerField()),
+        'last': Subquery(purchases.annotate(s=Max('created_at')).values('s')),
+    }
+
+
+def purchase_totals():
+    # Archived purchases still count: archiving moves history out of the live table, it does not refund it.
+    live, archived = user_totals(Purchase), user_totals(ArchivedPurchase)
+    return {
+        'spent': ExpressionWrapper(live['spent'] + archived['spent'], output_field=MONEY),
+        'tickets': ExpressionWrapper(live['tickets'] + archived['tickets'], output_field=IntegerField()),
+        # GREATEST skips NULLs on PostgreSQL.
+        'last': Greatest(live['last'], archived['last']),
+    }
+
+
+class Command(BaseCommand):
+    help = "Recomputes every user's total_spent, tickets_bought and last_purchase_at from live and archived purchases"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--verify', action='store_true', help='Only report users whose counters are wrong')
+
+    def handle(self, *args, **options):
+        totals = purchase_totals()
+        wrong = MyUser.objects.annotate(**totals).filter(
+            ~Q(total_spent=F('spent')) | ~Q(tickets_bought=F('tickets')) |
+            Q(last_purchase_at__lt=F('last')) | Q(last_purchase_at__gt=F('last')) |
+            Q(last_purchase_at__isnull=True, last__isnull=False) | Q(last_purchase_at__isnull=False, last__isnull=True))
+        if options['verify']:
+            rows = list(wrong.values_list('username', 'total_spent', 'spent', 'tickets_bought', 'tickets'))
+            for row in rows:
+                self.stdout.write('%s: spent %s (expected %s), tickets %s (expected %s)' % row)
+            if rows:
+                raise CommandError('%d users have wrong purchase counters' % len(rows))
+            self.stdout.write('All purchase counters are correct')
+            return
+        with transaction.atomic():
+            updated = MyUser.objects.update(total_spent=totals['spent'], tickets_bought=totals['tickets'],
+                                            last_purchase_at=totals['last'])
+        self.stdout.write('Rebuilt purchase counters of %d users' % updated)
@@ -0,0 +1,27 @@
+import time
+
+from django.core.management.base import BaseCommand
+from cinapp.reservations import release_expired
+
+
+class Command(BaseCommand):
+    help = 'Gives the seats of expired holds back to their sessions'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--interval', type=float, default=0,
+                            help='Keep running and sweep every INTERVAL seconds; by default sweep once and exit')
+
+    def handle(self, *args, **options):
+        while True:
+            released = 0
+            while True:
+                batch = release_expired(options['batch_size'])
+                released += batch
+                if batch < options['batch_size']:
+                    break
+            if released or not options['interval']:
+                self.stdout.write('Released %d holds' % released)
+            if not options['interval']:
+                return
+            time.sleep(options['interval'])
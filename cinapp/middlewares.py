@@ -1,4 +1,5 @@
-import datetime
+import time
+from django.conf import settings
 from django.contrib.auth import logout
 from django.utils.deprecation import MiddlewareMixin
 
@@ -6,15 +7,16 @@ from django.utils.deprecation import MiddlewareMixin
 class SessionDeadMiddleware(MiddlewareMixin):
 
     def process_request(self, request):
-        if not request.user.is_superuser:
-            try:
-                res = request.session.get('last_action')
-                res1 = datetime.datetime.strptime(res, '%Y-%m-%dT%H:%M:%S.%f')
-                delta = (datetime.datetime.now() - res1).seconds
-                if delta > 60:
-                    logout(request)
-            except TypeError or AttributeError:
-                request.session['last_action'] = datetime.datetime.now().isoformat()
-            request.session['last_action'] = datetime.datetime.now().isoformat()
-        else:
-            pass
+        # Anonymous visitors have nothing to expire, so they never touch the session.
+        if not request.user.is_authenticated or request.user.is_superuser:
+            return
+        now = int(time.time())
+        last_action = request.session.get('last_action')
+        if not isinstance(last_action, int):
+            request.session['last_action'] = now
+            return
+        idle = now - last_action
+        if idle > settings.SESSION_IDLE_TIMEOUT:
+            logout(request)
+        elif idle >= settings.SESSION_IDLE_TIMEOUT * settings.SESSION_TOUCH_FRACTION:
+            request.session['last_action'] = now
@@ -0,0 +1,27 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cinapp', '0004_alter_customtoken_last_action'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='myuser',
+            name='city',
+            field=models.CharField(choices=[('KV', 'Киев'), ('DN', 'Днепр'), ('ZP', 'Запорожье'), ('NI', 'Николаев'), ('CH', 'Херсон'), ('CHA', 'Харьков'), ('CHE', 'Хмельницкий'), ('JI', 'Житомир'), ('KR', 'Кривой Рог'), ('MP', 'Мариуполь'), ('RO', 'Ровное'), ('CHER', 'Чернигов'), ('LV', 'Львов'), ('PL', 'Полтава'), ('OD', 'Одесса'), ('LC', 'Луцк'), ('CHRS', 'Черкасы'), ('SM', 'Сумы'), ('VI', 'Вишневое'), ('IF', 'Ивано-Франковск'), ('BR', 'Бердянск'), ('VN', 'Виница'), ('SD', 'Северодонецк'), ('NK', 'Новая Каховка'), ('PG', 'Павлоград'), ('KR', 'Краматорск'), ('KRE', 'Кременчуг'), ('PK', 'Покровск'), ('BCH', 'Буча')], default='KV', max_length=300),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='myuser',
+            name='is_client',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='myuser',
+            name='is_reviewer',
+            field=models.BooleanField(default=False),
+        ),
+    ]
@@ -0,0 +1,38 @@
+from django.db import migrations, models
+
+
+def fill_seats(apps, schema_editor):
+    # Sessions sold before the seat map existed get their first sold seats marked as taken.
+    FilmSession = apps.get_model('cinapp', 'FilmSession')
+    for film_session in FilmSession.objects.select_related('hall').iterator():
+        sold = min(max(film_session.hall.size - film_session.hall_size, 0), film_session.hall.size)
+        if sold:
+            taken = (1 << sold) - 1
+            film_session.seats = taken.to_bytes((film_session.hall.size + 7) // 8, 'little')
+            film_session.save(update_fields=['seats'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cinapp', '0005_myuser_city_is_client_is_reviewer'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='hall',
+            name='row_size',
+            field=models.IntegerField(default=10),
+        ),
+        migrations.AddField(
+            model_name='filmsession',
+            name='seats',
+            field=models.BinaryField(default=b''),
+        ),
+        migrations.AddField(
+            model_name='purchase',
+            name='seats',
+            field=models.JSONField(default=list),
+        ),
+        migrations.RunPython(fill_seats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 4.0.1 on 2026-10-18 18:46
+
+import cinapp.models
+import django.contrib.postgres.constraints
+from django.db import migrations
+import django.db.models.expressions
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cinapp', '0006_seat_map'),
+    ]
+
+    operations = [
+        migrations.AddConstraint(
+            model_name='filmsession',
+            constraint=django.contrib.postgres.constraints.ExclusionConstraint(expressions=[(cinapp.models.Int8Range('hall', 'hall', django.db.models.expressions.Value('[]')), '&&'), (cinapp.models.TsTzRange('start', 'end'), '&&')], name='exclude_overlapping_sessions'),
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 4.0.1 on 2026-10-18 18:53
+
+from django.db import migrations, models
+from django.db.models import F, Max, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def fill_counters(apps, schema_editor):
+    MyUser = apps.get_model('cinapp', 'MyUser')
+    Purchase = apps.get_model('cinapp', 'Purchase')
+    purchases = Purchase.objects.filter(user=OuterRef('pk')).order_by().values('user')
+    MyUser.objects.update(
+        total_spent=Coalesce(Subquery(purchases.annotate(s=Sum(F('count') * F('film_session__price'))).values('s')),
+                             Value(0), output_field=models.DecimalField(max_digits=14, decimal_places=2)),
+        tickets_bought=Coalesce(Subquery(purchases.annotate(s=Sum('count')).values('s')), Value(0),
+                                output_field=models.IntegerField()),
+        last_purchase_at=Subquery(purchases.annotate(s=Max('created_at')).values('s')),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cinapp', '0007_session_overlap_constraint'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='myuser',
+            name='last_purchase_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='myuser',
+            name='tickets_bought',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='myuser',
+            name='total_spent',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=14),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
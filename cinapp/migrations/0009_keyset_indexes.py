@@ -0,0 +1,25 @@
+# Generated by Django 4.0.1 on 2026-10-18 18:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cinapp', '0008_myuser_purchase_counters'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='filmsession',
+            index=models.Index(fields=['start', 'id'], name='filmsession_start_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='filmsession',
+            index=models.Index(fields=['price', 'id'], name='filmsession_price_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='purchase',
+            index=models.Index(fields=['created_at', 'id'], name='purchase_created_id_idx'),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 4.0.1 on 2026-10-18 18:55
+
+from django.db import migrations, models
+import django.db.models.expressions
+import django.db.models.functions.text
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cinapp', '0009_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='film',
+            index=models.Index(django.db.models.functions.text.Upper('name'), django.db.models.expressions.F('start_premier'), django.db.models.expressions.F('end_premier'), name='film_upper_name_premier_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='filmsession',
+            index=models.Index(fields=['hall', 'start'], name='filmsession_hall_start_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='hall',
+            index=models.Index(django.db.models.functions.text.Upper('name'), name='hall_upper_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='purchase',
+            index=models.Index(fields=['user', 'created_at', 'id'], name='purchase_user_created_idx'),
+        ),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 4.0.1 on 2026-10-18 18:57
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cinapp', '0010_hot_path_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SalesRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('hour', models.SmallIntegerField()),
+                ('city', models.CharField(blank=True, choices=[('KV', 'Киев'), ('DN', 'Днепр'), ('ZP', 'Запорожье'), ('NI', 'Николаев'), ('CH', 'Херсон'), ('CHA', 'Харьков'), ('CHE', 'Хмельницкий'), ('JI', 'Житомир'), ('KR', 'Кривой Рог'), ('MP', 'Мариуполь'), ('RO', 'Ровное'), ('CHER', 'Чернигов'), ('LV', 'Львов'), ('PL', 'Полтава'), ('OD', 'Одесса'), ('LC', 'Луцк'), ('CHRS', 'Черкасы'), ('SM', 'Сумы'), ('VI', 'Вишневое'), ('IF', 'Ивано-Франковск'), ('BR', 'Бердянск'), ('VN', 'Виница'), ('SD', 'Северодонецк'), ('NK', 'Новая Каховка'), ('PG', 'Павлоград'), ('KR', 'Краматорск'), ('KRE', 'Кременчуг'), ('PK', 'Покровск'), ('BCH', 'Буча')], max_length=300)),
+                ('tickets', models.IntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('film', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='cinapp.film')),
+                ('hall', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='cinapp.hall')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='CapacityRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('hour', models.SmallIntegerField()),
+                ('sessions', models.IntegerField(default=0)),
+                ('seats', models.IntegerField(default=0)),
+                ('film', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='cinapp.film')),
+                ('hall', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='cinapp.hall')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='salesrollup',
+            constraint=models.UniqueConstraint(fields=('day', 'hour', 'film', 'hall', 'city'), name='salesrollup_key'),
+        ),
+        migrations.AddConstraint(
+            model_name='capacityrollup',
+            constraint=models.UniqueConstraint(fields=('day', 'hour', 'film', 'hall'), name='capacityrollup_key'),
+        ),
+    ]
@@ -0,0 +1,71 @@
+# Generated by Django 4.0.1 on 2026-10-18 19:41
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cinapp', '0013_idempotency_keys'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedFilmSession',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('film_id', models.BigIntegerField()),
+                ('film_name', models.CharField(max_length=60)),
+                ('film_genre', models.CharField(max_length=2)),
+                ('hall_id', models.BigIntegerField()),
+                ('hall_name', models.CharField(max_length=60)),
+                ('start', models.DateTimeField()),
+                ('end', models.DateTimeField()),
+                ('price', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('hall_size', models.IntegerField()),
+                ('archived_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ArchivedPurchase',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('count', models.IntegerField()),
+                ('seats', models.JSONField(default=list)),
+                ('created_at', models.DateTimeField()),
+                ('film_session', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='purchases', to='cinapp.archivedfilmsession')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='archivedfilmsession',
+            index=models.Index(fields=['start', 'id'], name='archivedsession_start_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='archivedpurchase',
+            index=models.Index(fields=['user', 'created_at', 'id'], name='archivedpurchase_user_idx'),
+        ),
+        migrations.AlterField(
+            model_name='capacityrollup',
+            name='film',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, to='cinapp.film'),
+        ),
+        migrations.AlterField(
+            model_name='capacityrollup',
+            name='hall',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, to='cinapp.hall'),
+        ),
+        migrations.AlterField(
+            model_name='salesrollup',
+            name='film',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, to='cinapp.film'),
+        ),
+        migrations.AlterField(
+            model_name='salesrollup',
+            name='hall',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, to='cinapp.hall'),
+        ),
+    ]
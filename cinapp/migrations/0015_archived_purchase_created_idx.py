@@ -0,0 +1,17 @@
+# Generated by Django 4.0.1 on 2026-10-18 19:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cinapp', '0014_archive_tables'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='archivedpurchase',
+            index=models.Index(fields=['created_at', 'id'], name='archivedpurchase_created_idx'),
+        ),
+    ]
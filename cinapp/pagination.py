@@ -0,0 +1,85 @@
+import base64
+import datetime
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+from rest_framework.pagination import CursorPagination
+
+
+class PurchaseCursorPagination(CursorPagination):
+    ordering = ('-created_at', '-id')
+    page_size = 20
+
+
+class FilmSessionCursorPagination(CursorPagination):
+    ordering = ('start', 'id')
+    page_size = 20
+
+
+class CursorEncoder(DjangoJSONEncoder):
+    # DjangoJSONEncoder cuts datetimes to milliseconds; a cursor keeps every microsecond, or the
+    # rows sharing the millisecond of the last row shown would be skipped or shown twice.
+    def default(self, o):
+        if isinstance(o, datetime.datetime):
+            return o.isoformat()
+        return super().default(o)
+
+
+def encode_cursor(keyset, obj):
+    values = [getattr(obj, field.lstrip('-')) for field in keyset]
+    return base64.urlsafe_b64encode(json.dumps(values, cls=CursorEncoder).encode()).decode()
+
+
+def decode_cursor(cursor):
+    try:
+        return json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (ValueError, AttributeError):
+        return None
+
+
+def after(keyset, values):
+    # (a, b) > (x, y) spelled as a > x OR (a = x AND b > y), honouring '-' for descending fields.
+    condition = Q()
+    equal = {}
+    for field, value in zip(keyset, values):
+        name = field.lstrip('-')
+        lookup = '%s__%s' % (name, 'lt' if field.startswith('-') else 'gt')
+        condition |= Q(**equal, **{lookup: value})
+        equal[name] = value
+    return condition
+
+
+class KeysetPaginationMixin:
+    # ListView pagination that seeks past the last row of the previous page instead of
+    # using OFFSET, so every page costs the same as the first one.
+    cursor_kwarg = 'cursor'
+    keyset = ('id',)
+
+    def get_keyset(self):
+        return self.keyset
+
+    def get_page_rows(self, queryset, keyset, values, limit):
+        queryset = queryset.order_by(*keyset)
+        if values:
+            queryset = queryset.filter(after(keyset, values))
+        return list(queryset[:limit])
+
+    def paginate_queryset(self, queryset, page_size):
+        keyset = self.get_keyset()
+        values = decode_cursor(self.request.GET.get(self.cursor_kwarg))
+        if not values or len(values) != len(keyset):
+            values = None
+        object_list = self.get_page_rows(queryset, keyset, values, page_size + 1)
+        has_next = len(object_list) > page_size
+        object_list = object_list[:page_size]
+        self.next_cursor = encode_cursor(keyset, object_list[-1]) if has_next else None
+        return None, None, object_list, has_next
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        if getattr(self, 'next_cursor', None):
+            params = self.request.GET.copy()
+            params[self.cursor_kwarg] = self.next_cursor
+            context['next_page_url'] = '?' + params.urlencode()
+        return context
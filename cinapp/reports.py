@@ -0,0 +1,107 @@
+import datetime
+
+from django.db import transaction, IntegrityError
+from django.db.models import Count, F, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce, ExtractHour, TruncDate
+from django.utils import timezone
+from cinapp.models import FilmSession, Purchase, ArchivedFilmSession, ArchivedPurchase, SalesRollup, CapacityRollup
+
+DIMENSIONS = ('day', 'hour', 'film', 'hall', 'city')
+
+
+def show_slot(film_session):
+    start = timezone.localtime(film_session.start)
+    return start.date(), start.hour
+
+
+def day_bounds(day_from, day_to):
+    start = timezone.make_aware(datetime.datetime.combine(day_from, datetime.time.min))
+    end = timezone.make_aware(datetime.datetime.combine(day_to + datetime.timedelta(days=1), datetime.time.min))
+    return start, end
+
+
+def record_sale(film_session, user, count, sum_):
+    # Called inside the purchase transaction; the rollup row is created on the first sale of the slot.
+    day, hour = show_slot(film_session)
+    key = {'day': day, 'hour': hour, 'film_id': film_session.film_id, 'hall_id': film_session.hall_id,
+           'city': user.city}
+    changes = {'tickets': F('tickets') + count, 'revenue': F('revenue') + sum_}
+    if SalesRollup.objects.filter(**key).update(**changes):
+        return
+    try:
+        with transaction.atomic():
+            SalesRollup.objects.create(tickets=count, revenue=sum_, **key)
+    except IntegrityError:
+        SalesRollup.objects.filter(**key).update(**changes)
+
+
+def refresh_capacity(day_from, day_to):
+    start, end = day_bounds(day_from, day_to)
+    slot = {'day': TruncDate('start'), 'hour': ExtractHour('start')}
+    rows = FilmSession.objects.filter(start__gte=start, start__lt=end).order_by().values(
+        'film', 'hall', **slot).annotate(sessions=Count('id'), seats=Sum('hall__size'))
+    # Archived sessions may have lost their hall; the seats they offered were the ones left plus the ones sold.
+    sold = ArchivedPurchase.objects.filter(film_session=OuterRef('pk')).order_by().values('film_session').annotate(
+        total=Sum('count')).values('total')
+    archived = ArchivedFilmSession.objects.filter(start__gte=start, start__lt=end).order_by().values(
+        film=F('film_id'), hall=F('hall_id'), **slot).annotate(
+        sessions=Count('id'), seats=Sum(F('hall_size') + Coalesce(Subquery(sold), 0)))
+    totals = merge_rows([rows, archived], ('day', 'hour', 'film', 'hall'), ('sessions', 'seats'))
+    with transaction.atomic():
+        CapacityRollup.objects.filter(day__gte=day_from, day__lte=day_to).delete()
+        CapacityRollup.objects.bulk_create(
+            [CapacityRollup(day=row['day'], hour=row['hour'], film_id=row['film'], hall_id=row['hall'],
+                            sessions=row['sessions'], seats=row['seats']) for row in totals], batch_size=1000)
+
+
+def refresh_sales(day_from, day_to):
+    # Rebuilds sales rollups from live and archived purchases; meant for backfills of days that are no longer selling.
+    start, end = day_bounds(day_from, day_to)
+    sources = [model.objects.filter(film_session__start__gte=start, film_session__start__lt=end).order_by().values(
+        day=TruncDate('film_session__start'), hour=ExtractHour('film_session__start'),
+        film=F('film_session__film_id'), hall=F('film_session__hall_id'), city=F('user__city')).annotate(
+        tickets=Sum('count'), revenue=Sum(F('count') * F('film_session__price')))
+        for model in (Purchase, ArchivedPurchase)]
+    totals = merge_rows(sources, DIMENSIONS, ('tickets', 'revenue'))
+    with transaction.atomic():
+        SalesRollup.objects.filter(day__gte=day_from, day__lte=day_to).delete()
+        SalesRollup.objects.bulk_create(
+            [SalesRollup(day=row['day'], hour=row['hour'], film_id=row['film'], hall_id=row['hall'],
+                         city=row['city'], tickets=row['tickets'], revenue=row['revenue']) for row in totals],
+            batch_size=1000)
+
+
+def merge_rows(sources, keys, sums):
+    # A slot can have both live and archived sessions, e.g. after one of them was deleted.
+    merged = {}
+    for rows in sources:
+        for row in rows:
+            key = tuple(row[name] for name in keys)
+            if key in merged:
+                for name in sums:
+                    merged[key][name] += row[name]
+            else:
+                merged[key] = dict(row)
+    return merged.values()
+
+
+def box_office(group_by, day_from=None, day_to=None, **filters):
+    # Answers dashboard queries from the rollups only. Occupancy needs seats, which do not
+    # depend on the buyer, so it is reported unless the query groups or filters by city.
+    filters = {name: value for name, value in filters.items() if value}
+    if day_from:
+        filters['day__gte'] = day_from
+    if day_to:
+        filters['day__lte'] = day_to
+    sales = SalesRollup.objects.filter(**filters).order_by(*group_by).values(*group_by).annotate(
+        tickets=Sum('tickets'), revenue=Sum('revenue'))
+    rows = list(sales)
+    if 'city' in group_by or 'city' in filters:
+        return rows
+    seats = {tuple(row[name] for name in group_by): row['seats'] for row in
+             CapacityRollup.objects.filter(**filters).order_by().values(*group_by).annotate(seats=Sum('seats'))}
+    for row in rows:
+        offered = seats.get(tuple(row[name] for name in group_by))
+        row['seats'] = offered
+        row['occupancy'] = round(row['tickets'] / offered, 4) if offered else None
+    return rows
@@ -0,0 +1,214 @@
+import datetime
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from django.db.models.signals import post_save
+from django.utils import timezone
+from rest_framework import serializers
+from cinapp.availability import announce, announce_many
+from cinapp.caching import session_listing
+from cinapp.models import MyUser, FilmSession, Purchase, SeatHold
+from cinapp.reports import record_sale, refresh_capacity
+from cinapp.seatmap import SeatMap
+
+
+def take_seats(film_session, count, seats):
+    # Locks the session row and marks the seats taken in its seat map; the caller stores the map.
+    locked = FilmSession.objects.select_for_update(of=('self',)).select_related('hall').get(id=film_session.id)
+    if locked.start <= timezone.now():
+        raise serializers.ValidationError('You can not buy ticket for this session because this one has already '
+                                          'started')
+    if count > locked.hall_size:
+        raise serializers.ValidationError('Sorry, not enough tickets')
+    seat_map = SeatMap.for_session(locked)
+    if seats is None:
+        seats = seat_map.find_adjacent(count) or seat_map.first_free(count)
+        if seats is None:
+            raise serializers.ValidationError('Sorry, not enough tickets')
+    seat_map.book(seats)
+    return locked, seat_map, seats
+
+
+def store_seats(locked, seat_map, count):
+    FilmSession.objects.filter(id=locked.id).update(hall_size=F('hall_size') - count, seats=seat_map.to_bytes())
+    announce(locked.id, locked.hall_size - count)
+    # A queryset update sends no post_save, and holds change the listed seats without a purchase.
+    transaction.on_commit(session_listing.invalidate)
+
+
+def charge(user, film_session, count, seats):
+    sum_ = count * film_session.price
+    purchase = Purchase.objects.create(film_session=film_session, user=user, count=count, seats=seats)
+    charged = MyUser.objects.filter(id=user.id, wallet__gte=sum_).update(
+        wallet=F('wallet') - sum_, total_spent=F('total_spent') + sum_,
+        tickets_bought=F('tickets_bought') + count, last_purchase_at=purchase.created_at)
+    if not charged:
+        raise serializers.ValidationError('Not enough money')
+    record_sale(film_session, user, count, sum_)
+    return purchase
+
+
+def settle(user, purchase):
+    sum_ = purchase.count * purchase.film_session.price
+    user.wallet = user.wallet - sum_
+    user.total_spent = user.total_spent + sum_
+    user.tickets_bought = user.tickets_bought + purchase.count
+    user.last_purchase_at = purchase.created_at
+
+
+def reserve_seats(user, film_session, count, seats=None):
+    # The session row is locked while its seat map is updated and the wallet is
+    # debited with a conditional UPDATE, so concurrent buyers can neither
+    # oversell the session nor overwrite each other's wallet.
+    if seats is not None:
+        count = len(seats)
+    with transaction.atomic():
+        locked, seat_map, seats = take_seats(film_session, count, seats)
+        purchase = charge(user, film_session, count, seats)
+        store_seats(locked, seat_map, count)
+    film_session.hall_size = locked.hall_size - count
+    film_session.seats = seat_map.to_bytes()
+    settle(user, purchase)
+    return purchase
+
+
+def checkout_cart(user, lines):
+    # One transaction for the whole cart: sessions are read and locked in one query in id
+    # order, so two carts sharing sessions cannot deadlock, the wallet is debited once and
+    # the purchases are inserted together.
+    counts = defaultdict(int)
+    for line in lines:
+        counts[line['film_session']] += line['count']
+    with transaction.atomic():
+        sessions = list(FilmSession.objects.select_for_update(of=('self',)).select_related('film', 'hall').filter(
+            id__in=counts).order_by('id'))
+        missing = set(counts) - {locked.id for locked in sessions}
+        if missing:
+            raise serializers.ValidationError('There is no session %s' % ', '.join(map(str, sorted(missing))))
+        purchases, seat_maps = [], []
+        for locked in sessions:
+            count = counts[locked.id]
+            if locked.start <= timezone.now():
+                raise serializers.ValidationError('You can not buy ticket for session %s because this one has '
+                                                  'already started' % locked.id)
+            seat_map = SeatMap.for_session(locked)
+            seats = count <= locked.hall_size and (seat_map.find_adjacent(count) or seat_map.first_free(count))
+            if not seats:
+                raise serializers.ValidationError('Sorry, not enough tickets for session %s' % locked.id)
+            seat_map.book(seats)
+            purchases.append(Purchase(film_session=locked, user=user, count=count, seats=seats))
+            seat_maps.append(seat_map)
+        sum_ = sum(purchase.count * purchase.film_session.price for purchase in purchases)
+        tickets = sum(counts.values())
+        purchases = Purchase.objects.bulk_create(purchases)
+        charged = MyUser.objects.filter(id=user.id, wallet__gte=sum_).update(
+            wallet=F('wallet') - sum_, total_spent=F('total_spent') + sum_,
+            tickets_bought=F('tickets_bought') + tickets, last_purchase_at=purchases[-1].created_at)
+        if not charged:
+            raise serializers.ValidationError('Not enough money')
+        for locked, seat_map, purchase in zip(sessions, seat_maps, purchases):
+            locked.hall_size -= purchase.count
+            locked.seats = seat_map.to_bytes()
+            record_sale(locked, user, purchase.count, purchase.count * locked.price)
+            announce(locked.id, locked.hall_size)
+            # bulk_create skips post_save; cache invalidation hangs off it.
+            post_save.send(sender=Purchase, instance=purchase, created=True)
+        FilmSession.objects.bulk_update(sessions, ['hall_size', 'seats'])
+    for purchase in purchases:
+        settle(user, purchase)
+    return purchases
+
+
+def hold_seats(user, film_session, count, seats=None):
+    # Held seats are taken out of the seat map at once, so other buyers see them as sold
+    # until the hold is confirmed, cancelled or released by the sweeper after SEAT_HOLD_TTL.
+    if seats is not None:
+        count = len(seats)
+    with transaction.atomic():
+        locked, seat_map, seats = take_seats(film_session, count, seats)
+        hold = SeatHold.objects.create(film_session=film_session, user=user, count=count, seats=seats,
+                                       expires_at=timezone.now() + datetime.timedelta(seconds=settings.SEAT_HOLD_TTL))
+        store_seats(locked, seat_map, count)
+    film_session.hall_size = locked.hall_size - count
+    film_session.seats = seat_map.to_bytes()
+    return hold
+
+
+def confirm_hold(user, hold_id):
+    with transaction.atomic():
+        hold = SeatHold.objects.select_for_update(of=('self',)).select_related('film_session').filter(
+            id=hold_id, user=user).first()
+        if hold is None or hold.expires_at <= timezone.now():
+            raise serializers.ValidationError('This hold has expired')
+        if hold.film_session.start <= timezone.now():
+            raise serializers.ValidationError('You can not buy ticket for this session because this one has already '
+                                              'started')
+        purchase = charge(user, hold.film_session, hold.count, hold.seats)
+        hold.delete()
+    settle(user, purchase)
+    return purchase
+
+
+def release_holds(holds):
+    # Holds are locked by the caller; sessions are locked in id order so that concurrent
+    # releases cannot deadlock, and all their seat maps are written in one UPDATE.
+    by_session = defaultdict(list)
+    for hold in holds:
+        by_session[hold.film_session_id].append(hold)
+    sessions = list(FilmSession.objects.select_for_update(of=('self',)).select_related('hall').filter(
+        id__in=by_session).order_by('id'))
+    for locked in sessions:
+        seat_map = SeatMap.for_session(locked)
+        for hold in by_session[locked.id]:
+            seat_map.release(hold.seats)
+            locked.hall_size += hold.count
+        locked.seats = seat_map.to_bytes()
+        announce(locked.id, locked.hall_size)
+    FilmSession.objects.bulk_update(sessions, ['hall_size', 'seats'])
+    SeatHold.objects.filter(id__in=[hold.id for hold in holds]).delete()
+    transaction.on_commit(session_listing.invalidate)
+
+
+def cancel_hold(user, hold_id):
+    with transaction.atomic():
+        hold = SeatHold.objects.select_for_update().filter(id=hold_id, user=user).first()
+        if hold is None:
+            raise serializers.ValidationError('This hold has expired')
+        release_holds([hold])
+
+
+def release_expired(batch_size=1000):
+    # One batch of the oldest expired holds, read from the expires_at index. Holds locked
+    # by a confirmation or another sweeper are skipped instead of waited for.
+    with transaction.atomic():
+        holds = list(SeatHold.objects.select_for_update(skip_locked=True).filter(
+            expires_at__lte=timezone.now()).order_by('expires_at', 'id').only(
+            'id', 'film_session_id', 'count', 'seats')[:batch_size])
+        if holds:
+            release_holds(holds)
+    return len(holds)
+
+
+def seats_taken(model):
+    return Coalesce(Subquery(model.objects.filter(film_session=OuterRef('pk')).order_by().values(
+        'film_session').annotate(total=Sum('count')).values('total')), 0)
+
+
+def resize_hall(hall):
+    # Called after the hall is saved with its new size. Remaining seats of the upcoming
+    # sessions are recomputed in one UPDATE from what is sold and held; past sessions keep
+    # theirs. The sessions are locked first, so purchases in flight commit before the
+    # UPDATE takes its snapshot and later ones wait for the resize.
+    with transaction.atomic():
+        upcoming = FilmSession.objects.filter(hall=hall, start__gt=timezone.now())
+        starts = list(upcoming.select_for_update().order_by('id').values_list('start', flat=True))
+        if not starts:
+            return 0
+        upcoming.update(hall_size=Value(hall.size) - seats_taken(Purchase) - seats_taken(SeatHold))
+        announce_many(upcoming.values_list('id', 'hall_size'))
+        first_day, last_day = timezone.localdate(min(starts)), timezone.localdate(max(starts))
+        transaction.on_commit(lambda: refresh_capacity(first_day, last_day))
+    return len(starts)
@@ -0,0 +1,79 @@
+from collections import defaultdict
+
+from django.db import transaction, IntegrityError
+from rest_framework import serializers
+from cinapp.caching import session_listing
+from cinapp.models import Film, Hall, FilmSession
+from cinapp.reports import refresh_capacity, show_slot
+from cinapp.snapshots import refresh_schedule
+from cinapp.validation import session_rule_errors
+
+
+class FilmSessionImportSerializer(serializers.Serializer):
+    # Plain ids instead of related fields: films and halls are loaded once per batch, not once per row.
+    film = serializers.IntegerField()
+    hall = serializers.IntegerField()
+    start = serializers.DateTimeField()
+    end = serializers.DateTimeField()
+    price = serializers.DecimalField(max_digits=12, decimal_places=2)
+
+
+def find_overlaps(items):
+    # Sweep every hall's new and already stored sessions in start order; one query for the whole batch.
+    by_hall = defaultdict(list)
+    for n, item in enumerate(items):
+        by_hall[item['hall']].append((item['start'], item['end'], n))
+    existing = FilmSession.objects.filter(hall_id__in=list(by_hall),
+                                          start__lt=max(item['end'] for item in items),
+                                          end__gt=min(item['start'] for item in items))
+    for hall_id, start, end in existing.values_list('hall_id', 'start', 'end'):
+        by_hall[hall_id].append((start, end, None))
+    booked = set()
+    for spans in by_hall.values():
+        spans.sort(key=lambda span: span[0])
+        last_end = last_row = None
+        for start, end, n in spans:
+            if last_end is not None and start < last_end:
+                booked.update(row for row in (n, last_row) if row is not None)
+            if last_end is None or end > last_end:
+                last_end, last_row = end, n
+    return booked
+
+
+def import_sessions(rows):
+    serializer = FilmSessionImportSerializer(data=rows, many=True)
+    if not serializer.is_valid():
+        if isinstance(serializer.errors, dict):
+            return 0, [{'row': None, 'errors': serializer.errors}]
+        return 0, [{'row': n, 'errors': e} for n, e in enumerate(serializer.errors) if e]
+    items = serializer.validated_data
+    if not items:
+        return 0, []
+    films = Film.objects.in_bulk({item['film'] for item in items})
+    halls = Hall.objects.in_bulk({item['hall'] for item in items})
+    errors = defaultdict(list)
+    for n, item in enumerate(items):
+        film = films.get(item['film'])
+        row_errors = ['There is no film with id %s' % item['film']] if film is None else \
+            [message for field, message in session_rule_errors(film, item['start'], item['end'], item['price'])]
+        if item['hall'] not in halls:
+            row_errors.append('There is no hall with id %s' % item['hall'])
+        if row_errors:
+            errors[n] = row_errors
+    for n in find_overlaps(items):
+        errors[n].append(FilmSession.BOOKED_MESSAGE)
+    if errors:
+        return 0, [{'row': n, 'errors': errors[n]} for n in sorted(errors)]
+    sessions = [FilmSession(film=films[item['film']], hall=halls[item['hall']], start=item['start'],
+                            end=item['end'], price=item['price'], hall_size=halls[item['hall']].size)
+                for item in items]
+    try:
+        with transaction.atomic():
+            FilmSession.objects.bulk_create(sessions, batch_size=1000)
+            transaction.on_commit(session_listing.invalidate)
+            days = sorted(show_slot(film_session)[0] for film_session in sessions)
+            transaction.on_commit(lambda: refresh_capacity(days[0], days[-1]))
+            transaction.on_commit(lambda: refresh_schedule(days))
+    except IntegrityError:
+        return 0, [{'row': None, 'errors': [FilmSession.BOOKED_MESSAGE]}]
+    return len(sessions), []
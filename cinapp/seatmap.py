@@ -0,0 +1,87 @@
+from rest_framework import serializers, status
+
+
+class SeatsTaken(serializers.ValidationError):
+    # Well formed, but someone was faster: a conflict with the current seat map.
+    status_code = status.HTTP_409_CONFLICT
+
+
+class SeatMap:
+    # Seat ``i`` of the hall sits in row ``i // row_size``; bit ``i`` of ``taken`` is set when it is sold.
+    # The bitmap is a Python int, so every operation below works a machine word at a time.
+
+    def __init__(self, size, row_size, data=b''):
+        self.size = size
+        self.row_size = max(min(row_size, size), 1)
+        self.full = (1 << size) - 1
+        self.taken = int.from_bytes(bytes(data), 'little') & self.full
+
+    @classmethod
+    def for_session(cls, film_session):
+        return cls(film_session.hall.size, film_session.hall.row_size, film_session.seats)
+
+    @property
+    def rows(self):
+        return -(-self.size // self.row_size)
+
+    @property
+    def free_count(self):
+        return self.size - bin(self.taken).count('1')
+
+    def to_bytes(self):
+        return self.taken.to_bytes((self.size + 7) // 8, 'little')
+
+    def is_free(self, seat):
+        return 0 <= seat < self.size and not self.taken >> seat & 1
+
+    def layout(self):
+        bits = format(self.taken, '0%db' % self.size)[::-1] if self.size else ''
+        line = bits.replace('0', '.').replace('1', 'x')
+        return [line[i:i + self.row_size] for i in range(0, self.size, self.row_size)]
+
+    def _row_starts(self, count):
+        # Mask of seats that can start a block of ``count`` without wrapping into the next row.
+        unit = (1 << (self.row_size - count + 1)) - 1
+        repeat = ((1 << (self.rows * self.row_size)) - 1) // ((1 << self.row_size) - 1)
+        return unit * repeat & ((1 << max(self.size - count + 1, 0)) - 1)
+
+    def find_adjacent(self, count):
+        if count <= 0 or count > self.row_size:
+            return None
+        runs = ~self.taken & self.full
+        span = 1
+        while span < count:
+            shift = min(span, count - span)
+            runs &= runs >> shift
+            span += shift
+        runs &= self._row_starts(count)
+        if not runs:
+            return None
+        first = (runs & -runs).bit_length() - 1
+        return list(range(first, first + count))
+
+    def first_free(self, count):
+        free = ~self.taken & self.full
+        seats = []
+        while free and len(seats) < count:
+            low = free & -free
+            seats.append(low.bit_length() - 1)
+            free ^= low
+        return seats if len(seats) == count else None
+
+    def book(self, seats):
+        mask = 0
+        for seat in seats:
+            if not 0 <= seat < self.size:
+                raise serializers.ValidationError('There is no seat %s in this hall' % seat)
+            mask |= 1 << seat
+        if bin(mask).count('1') != len(seats):
+            raise serializers.ValidationError('The same seat is selected twice')
+        if self.taken & mask:
+            raise SeatsTaken('Sorry, some of these seats are already taken')
+        self.taken |= mask
+
+    def release(self, seats):
+        for seat in seats:
+            if 0 <= seat < self.size:
+                self.taken &= ~(1 << seat)
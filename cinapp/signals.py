@@ -0,0 +1,64 @@
+from django.db import transaction
+from django.utils import timezone
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from cinapp.API.authentications import token_cache
+from cinapp.availability import announce
+from cinapp.caching import session_listing
+from cinapp.models import Hall, Film, FilmSession, Purchase, CustomToken, ScheduleSnapshot, \
+    sessions_archived
+from cinapp.reports import refresh_capacity, show_slot
+from cinapp.snapshots import refresh_schedule, snapshot_days
+
+
+@receiver([post_save, post_delete], sender=FilmSession)
+@receiver([post_save, post_delete], sender=Hall)
+@receiver([post_save, post_delete], sender=Film)
+@receiver([post_save, post_delete], sender=Purchase)
+def invalidate_session_listing(sender, **kwargs):
+    # After commit, otherwise a concurrent reader could cache the old rows again.
+    transaction.on_commit(session_listing.invalidate)
+
+
+@receiver(post_delete, sender=CustomToken)
+def invalidate_token(sender, instance, **kwargs):
+    transaction.on_commit(lambda: token_cache.delete(instance.key))
+
+
+@receiver([post_save, post_delete], sender=FilmSession)
+def refresh_session_capacity(sender, instance, **kwargs):
+    # A session moved to another day leaves its old day to the periodic backfill_rollups run.
+    day, hour = show_slot(instance)
+    transaction.on_commit(lambda: refresh_capacity(day, day))
+
+
+@receiver([post_save, post_delete], sender=FilmSession)
+def refresh_session_schedule(sender, instance, **kwargs):
+    # The snapshots still listing the session cover the day it was moved away from.
+    day, hour = show_slot(instance)
+    transaction.on_commit(lambda: refresh_schedule({day} | snapshot_days(instance.id)))
+
+
+@receiver([post_save, post_delete], sender=Hall)
+@receiver([post_save, post_delete], sender=Film)
+def refresh_named_schedule(sender, **kwargs):
+    # Renames are rare, and snapshots are kept for two days at most.
+    transaction.on_commit(lambda: refresh_schedule(snapshot_days()))
+
+
+@receiver(sessions_archived)
+def forget_archived_sessions(sender, first, last, **kwargs):
+    # Rollups of days already played keep the archived sessions, so box office history does not change.
+    transaction.on_commit(session_listing.invalidate)
+    listed = ScheduleSnapshot.objects.filter(day__gte=timezone.localdate(first), day__lte=timezone.localdate(last))
+    transaction.on_commit(lambda: refresh_schedule(listed.values_list('day', flat=True)))
+    today = timezone.localdate()
+    if timezone.localdate(last) >= today:
+        day_from = max(timezone.localdate(first), today)
+        transaction.on_commit(lambda: refresh_capacity(day_from, timezone.localdate(last)))
+
+
+@receiver(post_save, sender=FilmSession)
+def announce_availability(sender, instance, created, **kwargs):
+    if not created:
+        announce(instance.id, instance.hall_size)
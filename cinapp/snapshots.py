@@ -0,0 +1,98 @@
+import datetime
+import json
+from decimal import Decimal
+
+from django.db import transaction, IntegrityError
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from cinapp.models import Film, Hall, FilmSession, ScheduleSnapshot
+from cinapp.pagination import CursorEncoder
+
+# The today and tomorrow listings are read far more often than their sessions change, so
+# each of these days is kept as one ScheduleSnapshot row with the film and hall names
+# joined in and both orderings precomputed. A listing page is one read by day; writers
+# rebuild the snapshots their change touched once they commit.
+
+# Rows are lists in this order, the id being their only number; a page needs nothing else.
+COLUMNS = ('id', 'start', 'price', 'film__name', 'hall__name')
+KEYS = {'id': (0, int), 'start': (1, parse_datetime), 'price': (2, Decimal)}
+
+
+def listed_days():
+    today = timezone.localdate()
+    return {today, today + datetime.timedelta(days=1)}
+
+
+def build_snapshot(day, replace=True):
+    # Readers build a missing snapshot with replace=False, so one built from rows read
+    # before a concurrent change never overwrites the writer's rebuild.
+    rows = FilmSession.objects.on_day(day).order_by('start', 'id').values_list(*COLUMNS)
+    # Kept as they will be read back, with datetimes and prices as strings; starts keep their
+    # microseconds so they seek like the cursors pointing into them.
+    rows = json.loads(json.dumps(list(rows), cls=CursorEncoder))
+    by_price = sorted(range(len(rows)), key=lambda n: (Decimal(rows[n][2]), rows[n][0]))
+    snapshot = ScheduleSnapshot(day=day, rows=rows, by_price=by_price)
+    if not replace:
+        ScheduleSnapshot.objects.bulk_create([snapshot], ignore_conflicts=True)
+        return rows, by_price
+    values = {'rows': rows, 'by_price': by_price, 'built_at': snapshot.built_at}
+    if ScheduleSnapshot.objects.filter(day=day).update(**values):
+        return rows, by_price
+    try:
+        with transaction.atomic():
+            snapshot.save()
+    except IntegrityError:
+        ScheduleSnapshot.objects.filter(day=day).update(**values)
+    return rows, by_price
+
+
+def snapshot_days(session_id=None):
+    # All kept days, or those listing the session: jsonb containment of [[id]] matches
+    # a row holding that number, and the id is the only one.
+    snapshots = ScheduleSnapshot.objects.all()
+    if session_id is not None:
+        snapshots = snapshots.filter(rows__contains=[[session_id]])
+    return set(snapshots.values_list('day', flat=True))
+
+
+def refresh_schedule(days):
+    # Days that can not be listed yet are dropped and built on their first read instead.
+    days, listed = set(days), listed_days()
+    ScheduleSnapshot.objects.filter(Q(day__lt=min(listed)) | Q(day__in=days - listed)).delete()
+    for day in sorted(days & listed):
+        build_snapshot(day)
+
+
+def as_session(row):
+    return FilmSession(id=row[0], start=parse_datetime(row[1]), price=Decimal(row[2]),
+                       film=Film(name=row[3]), hall=Hall(name=row[4]))
+
+
+def seek(rows, order, keyset, values):
+    # Binary search over rows[order[...]] for the first row past the cursor, parsing only the keys it looks at.
+    keys = [KEYS[field] for field in keyset]
+    cursor = tuple(parse(value) for (column, parse), value in zip(keys, values))
+    low, high = 0, len(order)
+    while low < high:
+        middle = (low + high) // 2
+        if tuple(parse(rows[order[middle]][column]) for column, parse in keys) <= cursor:
+            low = middle + 1
+        else:
+            high = middle
+    return low
+
+
+def schedule_page(day, keyset, values, limit):
+    # The rows KeysetPaginationMixin would read from FilmSession.objects.on_day(day), ordered by
+    # ('start', 'id') or ('price', 'id') and past the cursor values, taken from the snapshot.
+    snapshot = ScheduleSnapshot.objects.filter(day=day).values_list('rows', 'by_price').first()
+    rows, by_price = snapshot or build_snapshot(day, replace=False)
+    order = by_price if keyset[0] == 'price' else range(len(rows))
+    position = 0
+    if values:
+        try:
+            position = seek(rows, order, keyset, values)
+        except (TypeError, ValueError, ArithmeticError):
+            position = 0
+    return [as_session(rows[n]) for n in order[position:position + limit]]
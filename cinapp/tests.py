@@ -1,3 +1,1100 @@
-from django.test import TestCase
+import csv
+import datetime
+import io
+import json
+import os
+import tempfile
+import threading
+import time
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from asgiref.testing import ApplicationCommunicator
+from django.conf import settings
+from django.db import connection, connections
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.core.cache import cache
+from django.core.management import call_command, CommandError
+from django.db.models import F
+from rest_framework import serializers
+from rest_framework.test import APIClient
+from .API.authentications import TokenDeadAuthentication
+from .availability import broker
+from .caching import session_listing
+from .reports import refresh_capacity, refresh_sales
+from .reservations import reserve_seats, release_expired
+from .seatmap import SeatMap, SeatsTaken
+from .models import MyUser, Hall, Film, FilmSession, Purchase, CustomToken, SeatHold, IdempotencyKey, \
+    ArchivedFilmSession, ArchivedPurchase, ScheduleSnapshot, SalesRollup, CapacityRollup
+
+
+class CinemaTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.now = timezone.now().replace(microsecond=0)
+        self.hall = Hall.objects.create(name='Red', size=50)
+        self.film = Film.objects.create(name='Dune', start_premier=self.now.date() - datetime.timedelta(days=30),
+                                        end_premier=self.now.date() + datetime.timedelta(days=30),
+                                        length=datetime.timedelta(hours=2))
+        self.user = MyUser.objects.create_user(username='client', password='secret', wallet=100000)
+        self.admin = MyUser.objects.create_superuser(username='admin', password='secret')
+
+    def make_sessions(self, count, hall=None, film=None, start=None):
+        start = start or self.now + datetime.timedelta(days=1)
+        hall = hall or self.hall
+        return [FilmSession.objects.create(film=film or self.film, hall=hall,
+                                           start=start + datetime.timedelta(hours=3 * i),
+                                           end=start + datetime.timedelta(hours=3 * i + 2),
+                                           price=100, hall_size=hall.size)
+                for i in range(count)]
+
+    def make_purchases(self, count, user=None):
+        user = user or self.user
+        return [Purchase.objects.create(film_session=film_session, user=user, count=1)
+                for film_session in self.make_sessions(count, hall=Hall.objects.create(name='Blue', size=50))]
+
+    def api_client(self, user):
+        client = APIClient()
+        client.force_authenticate(user)
+        return client
+
+    def walk_html(self, url):
+        seen = []
+        while url:
+            response = self.client.get(url)
+            seen.extend(obj.id for obj in response.context['object_list'])
+            url = response.context.get('next_page_url') and url.split('?')[0] + response.context['next_page_url']
+        return seen
+
+    def count_queries(self, client, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+
+class ListQueryCountTest(CinemaTestCase):
+    # Listing more rows must not issue more queries.
+
+    def setUp(self):
+        super().setUp()
+        session_listing.enabled = False
+        self.addCleanup(setattr, session_listing, 'enabled', True)
+
+    def assertConstantQueries(self, client, url, grow):
+        client.get(url)
+        grow(2)
+        few = self.count_queries(client, url)
+        grow(8)
+        self.assertEqual(self.count_queries(client, url), few)
+
+    def test_api_session_list(self):
+        self.assertConstantQueries(self.api_client(self.user), '/api/session/',
+                                   lambda n: self.make_sessions(n, hall=Hall.objects.create(name='h%s' % n, size=5)))
+
+    def test_api_purchase_list(self):
+        self.assertConstantQueries(self.api_client(self.user), '/api/purchase/',
+                                   lambda n: self.make_purchases(n))
+
+    def test_api_purchase_list_superuser(self):
+        other = MyUser.objects.create_user(username='other', password='secret')
+        self.assertConstantQueries(self.api_client(self.admin), '/api/purchase/',
+                                   lambda n: self.make_purchases(n, user=other))
+
+    def test_api_film_and_hall_lists(self):
+        client = self.api_client(self.user)
+        self.assertConstantQueries(client, '/api/hall/',
+                                   lambda n: Hall.objects.bulk_create([Hall(name='x%s' % i, size=5) for i in range(n)]))
+        self.assertConstantQueries(client, '/api/film/', lambda n: Film.objects.bulk_create(
+            [Film(name='f%s' % i, start_premier=self.film.start_premier, end_premier=self.film.end_premier,
+                  length=self.film.length) for i in range(n)]))
+
+    def test_html_session_list(self):
+        self.client.force_login(self.user)
+        self.assertConstantQueries(self.client, '/',
+                                   lambda n: self.make_sessions(n, hall=Hall.objects.create(name='h%s' % n, size=5)))
+
+    def test_html_purchase_list(self):
+        self.client.force_login(self.user)
+        self.assertConstantQueries(self.client, '/purchase/', lambda n: self.make_purchases(n))
+
+
+class SessionListingCacheTest(CinemaTestCase):
+    def test_repeated_listing_is_served_from_cache(self):
+        self.make_sessions(3)
+        client = self.api_client(self.user)
+        first = self.count_queries(client, '/api/session/?hall=Red')
+        self.assertLess(self.count_queries(client, '/api/session/?hall=Red'), first)
+
+    def test_changes_invalidate_listing(self):
+        client = self.api_client(self.user)
+        self.make_sessions(1)
+        self.assertEqual(len(client.get('/api/session/').data['results']), 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.make_sessions(1, start=self.now + datetime.timedelta(days=5))
+        self.assertEqual(len(client.get('/api/session/').data['results']), 2)
+        with self.captureOnCommitCallbacks(execute=True):
+            Purchase.objects.create(film_session=FilmSession.objects.first(), user=self.user, count=1)
+        hits = session_listing.hits
+        client.get('/api/session/')
+        self.assertEqual(session_listing.hits, hits)
+
+
+class TokenActivityTest(CinemaTestCase):
+    def setUp(self):
+        super().setUp()
+        self.token = CustomToken.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token.key)
+
+    def set_last_action(self, seconds_ago):
+        CustomToken.objects.filter(pk=self.token.pk).update(
+            last_action=timezone.now() - datetime.timedelta(seconds=seconds_ago))
+
+    def test_recent_activity_is_not_written(self):
+        self.set_last_action(5)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.client.get('/api/hall/').status_code, 200)
+        self.assertFalse([q for q in queries if q['sql'].startswith('UPDATE "cinapp_customtoken"')])
+
+    def test_stale_activity_is_written(self):
+        self.set_last_action(120)
+        self.assertEqual(self.client.get('/api/hall/').status_code, 200)
+        self.token.refresh_from_db()
+        self.assertLess(timezone.now() - self.token.last_action, datetime.timedelta(seconds=5))
+
+    def test_expired_token_is_rejected(self):
+        self.set_last_action(settings.TOKEN_TIME_TO_LIVE + 1)
+        self.assertEqual(self.client.get('/api/hall/').status_code, 401)
+        self.assertFalse(CustomToken.objects.filter(pk=self.token.pk).exists())
+
+    def test_steady_state_authentication_is_cached(self):
+        self.client.get('/api/hall/')
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get('/api/hall/')
+        self.assertFalse([q for q in queries if 'cinapp_customtoken' in q['sql']])
+
+    def test_deleted_token_is_not_served_from_cache(self):
+        self.client.get('/api/hall/')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.token.delete()
+        self.assertEqual(self.client.get('/api/hall/').status_code, 401)
+
+    def test_user_changes_reach_cached_tokens(self):
+        # Written behind the signals' back, as another worker's change would look to this one.
+        self.client.get('/api/hall/')
+        authentication = TokenDeadAuthentication()
+        first, second = (authentication.authenticate_credentials(self.token.key)[0] for _ in range(2))
+        self.assertTrue(authentication.cache_hit)
+        self.assertIsNot(first, second)
+        MyUser.objects.filter(pk=self.user.pk).update(is_active=False)
+        self.assertEqual(self.client.get('/api/hall/').status_code, 401)
+
+
+class SessionDeadMiddlewareTest(CinemaTestCase):
+    def session_writes(self, url='/film/'):
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.client.get(url).status_code, 200)
+        return [q for q in queries if 'django_session' in q['sql'] and not q['sql'].startswith('SELECT')]
+
+    def set_last_action(self, seconds_ago):
+        session = self.client.session
+        session['last_action'] = int(time.time()) - seconds_ago
+        session.save()
+
+    def test_anonymous_requests_do_not_touch_session(self):
+        self.assertFalse(self.session_writes())
+        self.assertNotIn(settings.SESSION_COOKIE_NAME, self.client.cookies)
+
+    def test_recent_activity_is_not_saved(self):
+        self.client.force_login(self.user)
+        self.set_last_action(1)
+        self.assertFalse(self.session_writes())
+
+    def test_activity_is_saved_after_touch_interval(self):
+        self.client.force_login(self.user)
+        self.set_last_action(int(settings.SESSION_IDLE_TIMEOUT * settings.SESSION_TOUCH_FRACTION) + 1)
+        self.assertTrue(self.session_writes())
+        self.assertGreaterEqual(self.client.session['last_action'], int(time.time()) - 1)
+
+    def test_idle_user_is_logged_out(self):
+        self.client.force_login(self.user)
+        self.set_last_action(settings.SESSION_IDLE_TIMEOUT + 1)
+        self.client.get('/film/')
+        self.assertNotIn('_auth_user_id', self.client.session)
+
+
+class ReservationTest(CinemaTestCase):
+    def setUp(self):
+        super().setUp()
+        self.film_session = self.make_sessions(1)[0]
+        MyUser.objects.filter(id=self.user.id).update(wallet=500)
+
+    def state(self):
+        self.user.refresh_from_db()
+        return FilmSession.objects.get(id=self.film_session.id).hall_size, self.user.wallet, Purchase.objects.count()
+
+    def buy_in_form(self, count):
+        self.client.force_login(self.user)
+        return self.client.post('/detail/%s/' % self.film_session.id,
+                                {'count': count, 'filmSession': self.film_session.id})
+
+    def test_api_and_form_purchases_debit_in_the_database(self):
+        client = self.api_client(self.user)
+        response = client.post('/api/purchase/', {'film_session': self.film_session.id, 'count': 2}, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertRedirects(self.buy_in_form(1), '/', fetch_redirect_response=False)
+        self.assertEqual(self.state(), (47, 200, 2))
+
+    def test_rejected_purchases_change_nothing(self):
+        client = self.api_client(self.user)
+        for count in (6, 51):
+            response = client.post('/api/purchase/', {'film_session': self.film_session.id, 'count': count},
+                                   format='json')
+            self.assertEqual(response.status_code, 400)
+        self.assertFormError(self.buy_in_form(6), 'form', 'count', 'Not enough money')
+        self.assertEqual(self.state(), (50, 500, 0))
+
+
+class ConcurrentReservationTest(TransactionTestCase):
+    # Buyers race on their own threads and connections; the database decides who gets the last seats.
+
+    def setUp(self):
+        start = timezone.now() + datetime.timedelta(days=1)
+        hall = Hall.objects.create(name='Red', size=5)
+        film = Film.objects.create(name='Dune', start_premier=start.date(), end_premier=start.date(),
+                                   length=datetime.timedelta(hours=2))
+        self.film_session = FilmSession.objects.create(film=film, hall=hall, start=start, price=100, hall_size=5,
+                                                       end=start + datetime.timedelta(hours=2))
+
+    def race(self, users):
+        results = []
+        barrier = threading.Barrier(len(users))
+
+        def buy(user):
+            barrier.wait()
+            try:
+                results.append(reserve_seats(user, FilmSession.objects.get(id=self.film_session.id), 1))
+            except serializers.ValidationError as e:
+                results.append(str(e.detail[0]))
+            connections.close_all()
+
+        threads = [threading.Thread(target=buy, args=(user,)) for user in users]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return sorted(result for result in results if isinstance(result, str))
+
+    def test_no_oversell(self):
+        users = [MyUser.objects.create_user(username='u%s' % n, password='secret') for n in range(8)]
+        self.assertEqual(self.race(users), ['Sorry, not enough tickets'] * 3)
+        self.assertEqual(FilmSession.objects.get(id=self.film_session.id).hall_size, 0)
+        self.assertEqual(Purchase.objects.count(), 5)
+        self.assertEqual(sorted(Purchase.objects.values_list('seats', flat=True)), [[0], [1], [2], [3], [4]])
+
+    def test_no_lost_wallet_update(self):
+        user = MyUser.objects.create_user(username='client', password='secret', wallet=300)
+        self.assertEqual(self.race([user] * 5), ['Not enough money'] * 2)
+        user.refresh_from_db()
+        self.assertEqual((user.wallet, user.tickets_bought, Purchase.objects.count()), (0, 3, 3))
+
+
+class PurchaseCountersTest(CinemaTestCase):
+    def test_purchase_updates_counters(self):
+        film_session = self.make_sessions(1)[0]
+        reserve_seats(self.user, film_session, 3)
+        self.user.refresh_from_db()
+        self.assertEqual((self.user.total_spent, self.user.tickets_bought), (300, 3))
+        self.assertEqual(self.user.wallet, 100000 - 300)
+        call_command('rebuild_user_stats', '--verify', stdout=io.StringIO())
+
+    def test_rebuild_fixes_wrong_counters(self):
+        reserve_seats(self.user, self.make_sessions(1)[0], 2)
+        MyUser.objects.filter(id=self.user.id).update(total_spent=0, tickets_bought=0)
+        with self.assertRaises(CommandError):
+            call_command('rebuild_user_stats', '--verify', stdout=io.StringIO())
+        call_command('rebuild_user_stats', stdout=io.StringIO())
+        self.user.refresh_from_db()
+        self.assertEqual((self.user.total_spent, self.user.tickets_bought), (200, 2))
+
+
+class BoxOfficeTest(CinemaTestCase):
+    def setUp(self):
+        super().setUp()
+        MyUser.objects.filter(id=self.user.id).update(city='KV')
+        self.user.refresh_from_db()
+        self.other = MyUser.objects.create_user(username='other', password='secret', wallet=1000, city='DN')
+        self.sessions = self.make_sessions(2)
+        reserve_seats(self.user, self.sessions[0], 2)
+        reserve_seats(self.user, self.sessions[0], 1)
+        reserve_seats(self.other, self.sessions[1], 4)
+        self.days = sorted({timezone.localdate(s.start) for s in self.sessions})
+
+    def sales(self):
+        return sorted(SalesRollup.objects.values_list('hour', 'film', 'hall', 'city', 'tickets', 'revenue'))
+
+    def test_record_sale_adds_to_the_slot(self):
+        hours = [timezone.localtime(s.start).hour for s in self.sessions]
+        self.assertEqual(self.sales(), sorted([(hours[0], self.film.id, self.hall.id, 'KV', 3, 300),
+                                               (hours[1], self.film.id, self.hall.id, 'DN', 4, 400)]))
+
+    def test_refresh_rebuilds_the_same_rollups(self):
+        recorded = self.sales()
+        SalesRollup.objects.all().delete()
+        refresh_sales(self.days[0], self.days[-1])
+        self.assertEqual(self.sales(), recorded)
+        refresh_capacity(self.days[0], self.days[-1])
+        self.assertEqual(list(CapacityRollup.objects.values_list('sessions', 'seats')), [(1, 50), (1, 50)])
+
+    def test_backfill_rollups(self):
+        recorded = self.sales()
+        SalesRollup.objects.all().delete()
+        call_command('backfill_rollups', '--capacity-only', stdout=io.StringIO())
+        self.assertEqual((SalesRollup.objects.count(), CapacityRollup.objects.count()), (0, 2))
+        call_command('backfill_rollups', stdout=io.StringIO())
+        self.assertEqual(self.sales(), recorded)
+
+    def test_reports_endpoint(self):
+        refresh_capacity(self.days[0], self.days[-1])
+        client = self.api_client(self.admin)
+        rows = client.get('/api/reports/?group_by=film').data
+        self.assertEqual(rows, [{'film': self.film.id, 'tickets': 7, 'revenue': 700, 'seats': 100,
+                                 'occupancy': 0.07}])
+        rows = client.get('/api/reports/?group_by=city&hall=%s' % self.hall.id).data
+        self.assertEqual([(row['city'], row['tickets']) for row in rows], [('DN', 4), ('KV', 3)])
+        self.assertEqual(client.get('/api/reports/?group_by=film&film=%s' % (self.film.id + 1)).data, [])
+        for query in ('group_by=seat', 'from=someday', 'film=abc', 'hall=1.5'):
+            self.assertEqual(client.get('/api/reports/?' + query).status_code, 400)
+        self.assertEqual(self.api_client(self.user).get('/api/reports/').status_code, 403)
+
+
+class KeysetPaginationTest(CinemaTestCase):
+    def setUp(self):
+        super().setUp()
+        session_listing.enabled = False
+        self.addCleanup(setattr, session_listing, 'enabled', True)
+
+    def test_html_session_pages(self):
+        sessions = self.make_sessions(25)
+        self.assertEqual(self.walk_html('/?period=1'), [obj.id for obj in sessions])
+        by_price = self.walk_html('/?period=1&ordering=1')
+        self.assertEqual(sorted(by_price), sorted(obj.id for obj in sessions))
+
+    def test_html_purchase_pages_within_one_millisecond(self):
+        # The last row of the first page and the first of the second share a millisecond.
+        purchases = self.make_purchases(11)
+        for n, purchase in enumerate(purchases):
+            Purchase.objects.filter(pk=purchase.pk).update(
+                created_at=self.now - datetime.timedelta(microseconds=100 * n))
+        self.client.login(username='client', password='secret')
+        self.assertEqual(self.walk_html('/purchase/'), [obj.id for obj in purchases])
+
+    def test_api_purchase_pages(self):
+        purchases = self.make_purchases(45)
+        client = self.api_client(self.user)
+        seen = []
+        url = '/api/purchase/'
+        while url:
+            data = client.get(url).data
+            seen.extend(row['id'] for row in data['results'])
+            url = data['next']
+        self.assertEqual(seen, [obj.id for obj in reversed(purchases)])
+
+
+class ScheduleOverlapTest(CinemaTestCase):
+    def setUp(self):
+        super().setUp()
+        self.booked = self.make_sessions(1)[0]
+        self.start = self.booked.start
+
+    def span(self, hours_from, hours_to):
+        return self.start + datetime.timedelta(hours=hours_from), self.start + datetime.timedelta(hours=hours_to)
+
+    def test_overlapping_lookup(self):
+        other = Hall.objects.create(name='Blue', size=50)
+        self.assertTrue(FilmSession.objects.overlapping(self.hall, *self.span(1, 3)).exists())
+        self.assertTrue(FilmSession.objects.overlapping(self.hall.id, *self.span(-1, 1)).exists())
+        self.assertFalse(FilmSession.objects.overlapping(self.hall, *self.span(2, 4)).exists())
+        self.assertFalse(FilmSession.objects.overlapping(other, *self.span(0, 2)).exists())
+
+    def test_constraint_rejects_overlapping_save(self):
+        start, end = self.span(1, 3)
+        with self.assertRaisesMessage(serializers.ValidationError, FilmSession.BOOKED_MESSAGE):
+            FilmSession(film=self.film, hall=self.hall, start=start, end=end, price=100, hall_size=50).save()
+        start, end = self.span(2, 4)
+        FilmSession.objects.create(film=self.film, hall=self.hall, start=start, end=end, price=100, hall_size=50)
+        self.assertEqual(FilmSession.objects.count(), 2)
+
+    def test_api_rejects_overlap_but_not_the_session_itself(self):
+        client = self.api_client(self.admin)
+        start, end = self.span(1, 3)
+        data = {'film': self.film.id, 'hall': self.hall.id, 'start': start, 'end': end, 'price': 100}
+        response = client.post('/api/session/', data, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn(FilmSession.BOOKED_MESSAGE, str(response.data))
+        data.update(start=self.booked.start, end=self.booked.end, price=120)
+        self.assertEqual(client.put('/api/session/%s/' % self.booked.id, data, format='json').status_code, 200)
+
+
+class HotQueryIndexTest(CinemaTestCase):
+    # The test tables are tiny, so sequential scans are disabled to see which index the planner can use.
+
+    def setUp(self):
+        super().setUp()
+        with connection.cursor() as cursor:
+            cursor.execute('SET LOCAL enable_seqscan = off')
+
+    def assertUsesIndex(self, queryset, index):
+        plan = queryset.explain()
+        self.assertIn(index, plan)
+
+    def test_sessions_of_the_day(self):
+        self.assertUsesIndex(FilmSession.objects.on_day(self.now.date()), 'filmsession_start_id_idx')
+
+    def test_sessions_by_hall_and_start(self):
+        self.assertUsesIndex(FilmSession.objects.filter(hall=self.hall, start__range=[self.now, self.now]),
+                             'filmsession_hall_start_idx')
+
+    def test_hall_by_name(self):
+        self.assertUsesIndex(Hall.objects.filter(name__iexact='red'), 'hall_upper_name_idx')
+
+    def test_film_duplicate_check(self):
+        self.assertUsesIndex(Film.objects.filter(name__iexact='dune', start_premier=self.film.start_premier,
+                                                 end_premier=self.film.end_premier),
+                             'film_upper_name_premier_idx')
+
+    def test_user_purchases(self):
+        self.assertUsesIndex(Purchase.objects.filter(user=self.user).order_by('-created_at', '-id'),
+                             'purchase_user_created_idx')
+
+    def test_purchase_pages(self):
+        self.assertUsesIndex(Purchase.objects.order_by('-created_at', '-id')[:20], 'purchase_created_id_idx')
+
+    def test_session_overlap(self):
+        end = self.now + datetime.timedelta(hours=2)
+        self.assertUsesIndex(FilmSession.objects.overlapping(self.hall, self.now, end), 'exclude_overlapping_sessions')
+
+
+class SalesAnalyticsTest(CinemaTestCase):
+    def setUp(self):
+        super().setUp()
+        self.cheap, self.dear = self.make_sessions(2)
+        FilmSession.objects.filter(pk=self.dear.pk).update(price=200)
+        for film_session, count, hours in ((self.cheap, 10, 50), (self.cheap, 10, 2), (self.dear, 5, 2)):
+            purchase = Purchase.objects.create(film_session=film_session, user=self.user, count=count)
+            Purchase.objects.filter(pk=purchase.pk).update(
+                created_at=film_session.start - datetime.timedelta(hours=hours))
+        day = self.now.date().isoformat()
+        self.url = '/api/analytics/?from=%s&to=%s' % (day, (self.now + datetime.timedelta(days=2)).date().isoformat())
+
+    def test_occupancy_fill_rate_and_elasticity(self):
+        cheap, dear, url = self.cheap, self.dear, self.url
+        result = self.api_client(self.admin).get(url).data
+        curve = {point['hours_before_start']: point['remaining'] for point in result['occupancy_curve']}
+        self.assertEqual((curve[168], curve[48], curve[1]), (1.0, 0.9, 0.75))
+        rates = {row['hour']: row['fill_rate'] for row in result['fill_rates']}
+        self.assertEqual(rates, {timezone.localtime(cheap.start).hour: 0.4, timezone.localtime(dear.start).hour: 0.1})
+        self.assertEqual(result['price_elasticity'][0]['elasticity'], -2.0)
+        self.assertEqual(self.api_client(self.user).get(url).status_code, 403)
+
+    def test_archived_sessions_keep_their_sales(self):
+        # The session is left with the seats it did not sell.
+        FilmSession.objects.filter(pk=self.dear.pk).update(hall_size=45)
+        client = self.api_client(self.admin)
+        result = client.get(self.url).data
+        FilmSession.objects.filter(pk=self.dear.pk).archive()
+        self.assertFalse(Purchase.objects.filter(film_session=self.dear).exists())
+        self.assertEqual(client.get(self.url).data, result)
+
+
+class SessionImportTest(CinemaTestCase):
+    url = '/api/session/bulk/'
+
+    def setUp(self):
+        super().setUp()
+        self.client = self.api_client(self.admin)
+        self.first = self.now + datetime.timedelta(days=1)
+
+    def row(self, hours, **fields):
+        start = self.first + datetime.timedelta(hours=hours)
+        return dict({'film': self.film.id, 'hall': self.hall.id, 'start': start.isoformat(),
+                     'end': (start + datetime.timedelta(hours=2)).isoformat(), 'price': '100'}, **fields)
+
+    def errors(self, rows):
+        response = self.client.post(self.url, rows, format='json')
+        self.assertEqual(response.status_code, 400)
+        return {error['row']: error['errors'] for error in response.data['errors']}
+
+    def test_import_rows(self):
+        response = self.client.post(self.url, [self.row(0), self.row(3), self.row(6)], format='json')
+        self.assertEqual((response.status_code, response.data), (201, {'created': 3}))
+        self.assertEqual(FilmSession.objects.count(), 3)
+        self.assertEqual(self.api_client(self.user).post(self.url, [self.row(9)], format='json').status_code, 403)
+
+    def test_overlaps_in_the_batch_and_with_stored_sessions(self):
+        self.make_sessions(1, start=self.first)
+        errors = self.errors([self.row(1), self.row(10), self.row(11), self.row(20)])
+        self.assertEqual(errors, {n: [FilmSession.BOOKED_MESSAGE] for n in (0, 1, 2)})
+        self.assertEqual(FilmSession.objects.count(), 1)
+
+    def test_errors_are_reported_per_row_and_nothing_is_inserted(self):
+        # Malformed rows are reported first; the rules run once every row parses.
+        errors = self.errors([self.row(0), self.row(3, start='soon'), self.row(6, price='x')])
+        self.assertEqual((sorted(errors), list(errors[1]), list(errors[2])), ([1, 2], ['start'], ['price']))
+        errors = self.errors([self.row(0), self.row(3, film=999), self.row(6, price='0'), self.row(9, hall=999)])
+        self.assertEqual(errors, {1: ['There is no film with id 999'], 2: ['Enter a correct price!'],
+                                  3: ['There is no hall with id 999']})
+        self.assertFalse(FilmSession.objects.exists())
+
+    def test_csv_body(self):
+        rows = [self.row(0), self.row(3)]
+        body = 'film,hall,start,end,price\n' + ''.join(
+            '{film},{hall},{start},{end},{price}\n'.format(**row) for row in rows)
+        response = self.client.post(self.url, body, content_type='text/csv')
+        self.assertEqual((response.status_code, response.data), (201, {'created': 2}))
+        self.assertEqual(list(FilmSession.objects.order_by('start').values_list('price', flat=True)), [100, 100])
+
+
+class PurchaseExportTest(CinemaTestCase):
+    def setUp(self):
+        super().setUp()
+        self.recent, self.old = self.make_purchases(2)
+        Purchase.objects.filter(id=self.old.id).update(created_at=self.now - datetime.timedelta(days=3))
+        self.client = self.api_client(self.admin)
+
+    def export(self, query):
+        response = self.client.get('/api/purchase-export/?' + query)
+        self.assertEqual(response.status_code, 200)
+        return b''.join(response.streaming_content).decode()
+
+    def test_csv(self):
+        rows = list(csv.reader(io.StringIO(self.export('output=csv'))))
+        self.assertEqual(rows[0][:3], ['id', 'created_at', 'username'])
+        self.assertEqual([(row[0], row[2], row[5], row[-1]) for row in rows[1:]],
+                         [(str(p.id), 'client', 'Blue', '100.00') for p in (self.recent, self.old)])
+
+    def test_ndjson_and_date_range(self):
+        today, old_day = timezone.localdate(), timezone.localdate(self.now - datetime.timedelta(days=3))
+        rows = [json.loads(line) for line in self.export('output=ndjson&from=%s' % today).splitlines()]
+        self.assertEqual([(row['id'], row['film'], row['count']) for row in rows], [(self.recent.id, 'Dune', 1)])
+        rows = self.export('output=ndjson&from=%s&to=%s' % (old_day, old_day)).splitlines()
+        self.assertEqual([json.loads(line)['id'] for line in rows], [self.old.id])
+
+    def test_archived_purchases_are_exported(self):
+        expected = self.export('output=csv')
+        FilmSession.objects.filter(purchase=self.old).archive()
+        self.assertEqual(ArchivedPurchase.objects.get().id, self.old.id)
+        self.assertEqual(self.export('output=csv'), expected)
+
+    def test_bad_parameters_and_permission(self):
+        self.assertEqual(self.client.get('/api/purchase-export/?output=xml').status_code, 400)
+        self.assertEqual(self.client.get('/api/purchase-export/?to=yesterday').status_code, 400)
+        self.assertEqual(self.api_client(self.user).get('/api/purchase-export/').status_code, 403)
+
+    def test_export_purchases_command(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'purchases.ndjson')
+            call_command('export_purchases', format='ndjson', date_from=timezone.localdate(), output=path)
+            with open(path) as export:
+                self.assertEqual([json.loads(line)['id'] for line in export], [self.recent.id])
+
+
+class SeatMapTest(TestCase):
+    def test_find_adjacent_stays_in_one_row(self):
+        seat_map = SeatMap(10, 5)
+        seat_map.book([0, 1, 2])
+        self.assertEqual(seat_map.find_adjacent(3), [5, 6, 7])
+        self.assertEqual(seat_map.find_adjacent(2), [3, 4])
+        self.assertIsNone(seat_map.find_adjacent(6))
+        short_row = SeatMap(7, 3)
+        short_row.book([0, 2, 3, 5])
+        self.assertIsNone(short_row.find_adjacent(2))
+        self.assertEqual(SeatMap(7, 3, b'\x3f').find_adjacent(1), [6])
+        self.assertIsNone(SeatMap(7, 3, b'\x3f').find_adjacent(2))
+
+    def test_first_free(self):
+        seat_map = SeatMap(5, 5)
+        seat_map.book([0, 2])
+        self.assertEqual(seat_map.first_free(3), [1, 3, 4])
+        self.assertIsNone(seat_map.first_free(4))
+
+    def test_book(self):
+        seat_map = SeatMap(6, 3)
+        seat_map.book([1, 4])
+        self.assertEqual((seat_map.free_count, seat_map.layout()), (4, ['.x.', '.x.']))
+        self.assertEqual(SeatMap(6, 3, seat_map.to_bytes()).taken, seat_map.taken)
+        for seats, error in (([2, 2], serializers.ValidationError), ([6], serializers.ValidationError),
+                             ([-1], serializers.ValidationError), ([0, 4], SeatsTaken)):
+            with self.assertRaises(error):
+                seat_map.book(seats)
+        self.assertEqual(seat_map.free_count, 4)
+
+
+class SeatsEndpointTest(CinemaTestCase):
+    def setUp(self):
+        super().setUp()
+        self.film_session = self.make_sessions(1)[0]
+        self.url = '/api/session/%s/seats/' % self.film_session.id
+
+    def test_get_seat_map(self):
+        reserve_seats(self.user, self.film_session, None, seats=[0, 1])
+        data = APIClient().get(self.url + '?adjacent=3').data
+        self.assertEqual((data['rows'], data['row_size'], data['free']), (5, 10, 48))
+        self.assertEqual(data['layout'][0], 'xx........')
+        self.assertEqual(data['adjacent'], [2, 3, 4])
+
+    def test_post_seats(self):
+        client = self.api_client(self.user)
+        response = client.post(self.url, {'seats': [5, 6]}, format='json')
+        self.assertEqual((response.status_code, response.data['seats']), (201, [5, 6]))
+        self.assertEqual(client.post(self.url, {'seats': [6, 7]}, format='json').status_code, 409)
+        for seats in ([], [99], [1, 1]):
+            self.assertEqual(client.post(self.url, {'seats': seats}, format='json').status_code, 400)
+        self.assertEqual(APIClient().post(self.url, {'seats': [1]}, format='json').status_code, 401)
+        self.assertEqual(FilmSession.objects.get(id=self.film_session.id).hall_size, 48)
+
+
+class SeatHoldTest(CinemaTestCase):
+    def setUp(self):
+        super().setUp()
+        self.film_session = self.make_sessions(1)[0]
+        self.client = self.api_client(self.user)
+
+    def hold(self, count):
+        response = self.client.post('/api/hold/', {'film_session': self.film_session.id, 'count': count})
+        self.assertEqual(response.status_code, 201)
+        return response.data['id']
+
+    def free_seats(self):
+        return FilmSession.objects.get(id=self.film_session.id).hall_size
+
+    def test_hold_and_confirm(self):
+        hold = self.hold(3)
+        self.assertEqual(self.free_seats(), 47)
+        response = self.client.post('/api/hold/%s/confirm/' % hold)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['seats'], [0, 1, 2])
+        self.user.refresh_from_db()
+        self.assertEqual((self.user.wallet, self.user.tickets_bought, self.free_seats()), (99700, 3, 47))
+        self.assertFalse(SeatHold.objects.exists())
+
+    def test_cancel_returns_seats(self):
+        hold = self.hold(3)
+        self.assertEqual(self.client.delete('/api/hold/%s/' % hold).status_code, 204)
+        self.assertEqual(self.free_seats(), 50)
+        self.assertEqual(self.hold(2), SeatHold.objects.get().id)
+        self.assertEqual(SeatHold.objects.get().seats, [0, 1])
+
+    def test_holds_refresh_the_cached_listing(self):
+        def listed_seats():
+            return self.client.get('/api/session/').data['results'][0]['hall_size']
+
+        self.assertEqual(listed_seats(), 50)
+        with self.captureOnCommitCallbacks(execute=True):
+            hold = self.hold(5)
+        self.assertEqual(listed_seats(), 45)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.delete('/api/hold/%s/' % hold)
+        self.assertEqual(listed_seats(), 50)
+
+    def test_expired_holds_are_swept(self):
+        kept, expired = self.hold(2), self.hold(3)
+        SeatHold.objects.filter(id=expired).update(expires_at=self.now - datetime.timedelta(seconds=1))
+        self.assertEqual(self.client.post('/api/hold/%s/confirm/' % expired).status_code, 400)
+        self.assertEqual(release_expired(batch_size=10), 1)
+        self.assertEqual(self.free_seats(), 48)
+        self.assertEqual(list(SeatHold.objects.values_list('id', flat=True)), [kept])
+        reserve_seats(self.user, FilmSession.objects.get(id=self.film_session.id), 3)
+        self.assertEqual(Purchase.objects.get().seats, [2, 3, 4])
+
+
+class CheckoutTest(CinemaTestCase):
+    def checkout(self, lines):
+        return self.api_client(self.user).post('/api/purchase/checkout/', {'lines': lines}, format='json')
+
+    def test_cart_is_bought_in_one_transaction(self):
+        first, second = self.make_sessions(2)
+        lines = [{'film_session': second.id, 'count': 2}, {'film_session': first.id, 'count': 1},
+                 {'film_session': second.id, 'count': 1}]
+        with CaptureQueriesContext(connection) as queries:
+            response = self.checkout(lines)
+        self.assertEqual(response.status_code, 201)
+        for table in ('INSERT INTO "cinapp_purchase"', 'UPDATE "cinapp_myuser"'):
+            self.assertEqual(len([q for q in queries if q['sql'].startswith(table)]), 1)
+        self.assertEqual([(row['film_session']['id'], row['count']) for row in response.data],
+                         [(first.id, 1), (second.id, 3)])
+        self.user.refresh_from_db()
+        self.assertEqual((self.user.wallet, self.user.tickets_bought), (99600, 4))
+        self.assertEqual(list(FilmSession.objects.order_by('id').values_list('hall_size', flat=True)), [49, 47])
+
+    def test_one_bad_line_rejects_the_cart(self):
+        first, second = self.make_sessions(2)
+        response = self.checkout([{'film_session': first.id, 'count': 1}, {'film_session': second.id, 'count': 51}])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.checkout([{'film_session': 0, 'count': 1}]).status_code, 400)
+        self.assertFalse(Purchase.objects.exists())
+        self.assertEqual(FilmSession.objects.get(id=first.id).hall_size, 50)
+
+
+class AsyncViewTestCase(TransactionTestCase):
+    # The async views run their queries on executor threads with their own connections,
+    # which cannot see the uncommitted data of a TestCase.
+
+    def setUp(self):
+        start = timezone.now() + datetime.timedelta(days=1)
+        hall = Hall.objects.create(name='Red', size=5)
+        film = Film.objects.create(name='Dune', start_premier=start.date(), end_premier=start.date(),
+                                   length=datetime.timedelta(hours=2))
+        self.film_session = FilmSession.objects.create(film=film, hall=hall, start=start, price=100, hall_size=5,
+                                                       end=start + datetime.timedelta(hours=2))
+        self.user = MyUser.objects.create_user(username='client', password='secret', wallet=250)
+        self.token = CustomToken.objects.create(user=self.user)
+
+    def buy(self, count, token=None):
+        return self.client.post('/api/async/purchase/', {'film_session': self.film_session.id, 'count': count},
+                                content_type='application/json',
+                                HTTP_AUTHORIZATION='Token ' + (token or self.token.key))
+
+
+class AsyncPurchaseTest(AsyncViewTestCase):
+    def test_purchase(self):
+        response = self.buy(2)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json(), {'film_session': self.film_session.id, 'count': 2})
+        self.user.refresh_from_db()
+        self.assertEqual((self.user.wallet, self.user.tickets_bought), (50, 2))
+        self.assertEqual(self.client.get('/api/async/session/%s/availability/' % self.film_session.id).json()['free'],
+                         3)
+
+    def test_rejections(self):
+        self.assertEqual(self.buy(1, token='x' * 40).status_code, 401)
+        self.assertEqual(self.buy(0).status_code, 400)
+        self.assertEqual(self.buy(3).json(), {'non_field_errors': ['Not enough money']})
+        self.assertEqual(self.client.get('/api/async/purchase/').status_code, 405)
+        self.assertFalse(Purchase.objects.exists())
+
+
+class AvailabilityStreamTest(AsyncViewTestCase):
+    def stream(self, pk):
+        from Cinema.asgi import application
+        scope = {'type': 'http', 'method': 'GET', 'path': '/api/session/%s/availability/stream' % pk,
+                 'query_string': b'', 'headers': []}
+        return ApplicationCommunicator(application, scope)
+
+    async def test_purchases_are_pushed(self):
+        stream = self.stream(self.film_session.id)
+        await stream.send_input({'type': 'http.request'})
+        self.assertEqual((await stream.receive_output(5))['status'], 200)
+        self.assertEqual((await stream.receive_output(5))['body'], b'data: {"hall_size": 5}\n\n')
+        await sync_to_async(reserve_seats)(self.user, self.film_session, 2)
+        self.assertEqual((await stream.receive_output(5))['body'], b'data: {"hall_size": 3}\n\n')
+        await stream.send_input({'type': 'http.disconnect'})
+        await stream.wait(5)
+        self.assertEqual(broker.watchers(), 0)
+
+    async def test_unknown_session(self):
+        stream = self.stream(0)
+        await stream.send_input({'type': 'http.request'})
+        self.assertEqual((await stream.receive_output(5))['status'], 404)
+
+
+class IdempotentPurchaseTest(TransactionTestCase):
+    # Each replay runs on its own thread and database connection, like separate workers.
+
+    def setUp(self):
+        start = timezone.now() + datetime.timedelta(days=1)
+        hall = Hall.objects.create(name='Red', size=50)
+        film = Film.objects.create(name='Dune', start_premier=start.date(), end_premier=start.date(),
+                                   length=datetime.timedelta(hours=2))
+        self.film_session = FilmSession.objects.create(film=film, hall=hall, start=start, price=100, hall_size=50,
+                                                       end=start + datetime.timedelta(hours=2))
+        self.user = MyUser.objects.create_user(username='client', password='secret', wallet=1000)
+        self.token = CustomToken.objects.create(user=self.user)
+
+    def buy(self, key, count=2):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION='Token ' + self.token.key, HTTP_IDEMPOTENCY_KEY=key)
+        return client.post('/api/purchase/', {'film_session': self.film_session.id, 'count': count}, format='json')
+
+    def replay_in_parallel(self, key, times):
+        responses = []
+        barrier = threading.Barrier(times)
+
+        def replay():
+            barrier.wait()
+            responses.append(self.buy(key))
+            connections.close_all()
+
+        threads = [threading.Thread(target=replay) for _ in range(times)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return responses
+
+    def test_parallel_replays_charge_once(self):
+        responses = self.replay_in_parallel('checkout-1', 8)
+        self.assertEqual([response.status_code for response in responses], [201] * 8)
+        self.assertEqual([response.json() for response in responses], [responses[0].json()] * 8)
+        self.assertEqual(sum(response.has_header('Idempotent-Replayed') for response in responses), 7)
+        self.user.refresh_from_db()
+        self.assertEqual((Purchase.objects.count(), self.user.wallet), (1, 800))
+
+    def test_keys_are_per_request(self):
+        self.assertEqual(self.buy('a').status_code, 201)
+        self.assertEqual(self.buy('b').status_code, 201)
+        self.assertEqual(self.buy('a', count=3).status_code, 422)
+        self.assertEqual(Purchase.objects.count(), 2)
+
+    def test_failed_request_is_not_stored(self):
+        self.assertEqual(self.buy('big', count=20).status_code, 400)
+        self.assertFalse(IdempotencyKey.objects.exists())
+        self.assertEqual(self.buy('small').status_code, 201)
+
+
+class ValidationQueryBudgetTest(CinemaTestCase):
+    # Every write endpoint validates with at most one query beyond loading what it writes.
+
+    def assertQueryBudget(self, budget, request, status_code):
+        with CaptureQueriesContext(connection) as queries:
+            response = request()
+        self.assertEqual(response.status_code, status_code)
+        self.assertLessEqual(len(queries), budget)
+        return response
+
+    def session_data(self, **changes):
+        start = self.now + datetime.timedelta(days=2)
+        return {'film': self.film.id, 'hall': self.hall.id, 'start': start.isoformat(),
+                'end': (start + datetime.timedelta(hours=2)).isoformat(), 'price': 100, **changes}
+
+    def test_api_film(self):
+        data = {'name': 'Arrival', 'start_premier': self.film.start_premier, 'end_premier': self.film.end_premier,
+                'length': '02:00:00', 'genre': self.film.genre}
+        client = self.api_client(self.admin)
+        self.assertQueryBudget(2, lambda: client.post('/api/film/', data), 201)
+        self.assertQueryBudget(1, lambda: client.post('/api/film/', data), 400)
+        self.assertQueryBudget(0, lambda: client.post('/api/film/', {**data, 'length': '01:00:00'}), 400)
+
+    def test_api_hall(self):
+        client = self.api_client(self.admin)
+        self.assertQueryBudget(2, lambda: client.post('/api/hall/', {'name': 'Green', 'size': 30}), 201)
+        self.assertQueryBudget(2, lambda: client.put('/api/hall/%s/' % self.hall.id,
+                                                      {'name': 'green', 'size': 30}), 400)
+        self.make_purchases(1)
+        blue = Hall.objects.get(name='Blue')
+        response = self.assertQueryBudget(2, lambda: client.put('/api/hall/%s/' % blue.id,
+                                                                 {'name': 'Blue', 'size': 30}), 400)
+        self.assertEqual(response.data['non_field_errors'][0],
+                         'You can not edit this hall because tickets with this one was sold')
+
+    def test_api_session(self):
+        client = self.api_client(self.admin)
+        self.assertQueryBudget(6, lambda: client.post('/api/session/', self.session_data()), 201)
+        response = self.assertQueryBudget(3, lambda: client.post('/api/session/', self.session_data()), 400)
+        self.assertEqual(response.data['non_field_errors'][0], FilmSession.BOOKED_MESSAGE)
+        sold = self.make_purchases(1)[0].film_session
+        response = self.assertQueryBudget(4, lambda: client.put('/api/session/%s/' % sold.id,
+                                                                 self.session_data(hall=sold.hall_id)), 400)
+        self.assertEqual(response.data['non_field_errors'][0],
+                         'You can not edit this session because tickets with this one was sold')
+
+    def test_api_purchase(self):
+        film_session = self.make_sessions(1)[0]
+        client = self.api_client(self.user)
+        self.assertQueryBudget(11, lambda: client.post('/api/purchase/', {'film_session': film_session.id,
+                                                                           'count': 2}), 201)
+        self.assertQueryBudget(1, lambda: client.post('/api/purchase/', {'film_session': film_session.id,
+                                                                           'count': 60}), 400)
+
+    def test_html_forms(self):
+        film_session = self.make_sessions(1)[0]
+        self.client.force_login(self.admin)
+        self.assertQueryBudget(2, lambda: self.client.post('/hall/create/', {'name': 'red', 'size': 5,
+                                                                               'row_size': 5}), 200)
+        self.assertQueryBudget(9, lambda: self.client.post('/sessions/create/', self.session_data()), 302)
+        self.client.force_login(self.user)
+        response = self.assertQueryBudget(5, lambda: self.client.post('/detail/%s/' % film_session.id,
+                                                                       {'count': 1000}), 200)
+        self.assertFormError(response, 'form', 'count', 'Sorry, not enough tickets')
+        self.assertQueryBudget(12, lambda: self.client.post('/detail/%s/' % film_session.id, {'count': 2}), 302)
+
+
+class HallResizeTest(CinemaTestCase):
+    def setUp(self):
+        super().setUp()
+        self.past = self.make_sessions(1, start=self.now - datetime.timedelta(days=1))[0]
+        self.sold, self.empty = self.make_sessions(2)
+        Purchase.objects.create(film_session=self.past, user=self.user, count=4)
+        FilmSession.objects.filter(id=self.past.id).update(hall_size=46)
+        reserve_seats(self.user, self.sold, 3)
+        SeatHold.objects.create(film_session=self.sold, user=self.user, count=2, seats=[3, 4],
+                                expires_at=self.now + datetime.timedelta(minutes=10))
+
+    def remaining(self):
+        return list(FilmSession.objects.order_by('id').values_list('hall_size', flat=True))
+
+    def test_upcoming_sessions_keep_sold_and_held_seats(self):
+        client = self.api_client(self.admin)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = client.put('/api/hall/%s/' % self.hall.id, {'name': 'Red', 'size': 60})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.remaining(), [46, 55, 60])
+        self.client.force_login(self.admin)
+        response = self.client.post('/hall/update/%s/' % self.hall.id, {'name': 'Red', 'size': 70, 'row_size': 10})
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(self.remaining(), [46, 65, 70])
+
+    def test_hall_with_upcoming_sales_cannot_shrink(self):
+        response = self.api_client(self.admin).put('/api/hall/%s/' % self.hall.id, {'name': 'Red', 'size': 40})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.remaining(), [46, 47, 50])
+
+
+class GuardedDeleteTest(CinemaTestCase):
+    def setUp(self):
+        super().setUp()
+        self.played = self.make_sessions(2, start=self.now - datetime.timedelta(days=2))
+        self.upcoming = self.make_sessions(1)[0]
+        for film_session in self.played:
+            Purchase.objects.create(film_session=film_session, user=self.user, count=2, seats=[0, 1])
+
+    def test_sold_upcoming_session_blocks_delete(self):
+        Purchase.objects.create(film_session=self.upcoming, user=self.user, count=1)
+        client = self.api_client(self.admin)
+        self.assertEqual(client.delete('/api/session/%s/' % self.upcoming.id).status_code, 400)
+        self.assertEqual(client.delete('/api/hall/%s/' % self.hall.id).status_code, 400)
+        with CaptureQueriesContext(connection) as queries:
+            with self.assertRaises(serializers.ValidationError):
+                Film.objects.filter(id=self.film.id).delete()
+        self.assertEqual(len([q for q in queries if 'EXISTS' in q['sql'] or 'LIMIT 1' in q['sql']]), 1)
+        self.assertEqual(FilmSession.objects.count(), 3)
+
+    def test_deleted_sessions_are_archived_with_purchases(self):
+        self.assertEqual(self.api_client(self.admin).delete('/api/hall/%s/' % self.hall.id).status_code, 204)
+        self.assertFalse(FilmSession.objects.exists())
+        self.assertFalse(Purchase.objects.exists())
+        archived = ArchivedFilmSession.objects.order_by('id')
+        self.assertEqual([(s.id, s.hall_name, s.film_name) for s in archived],
+                         [(s.id, 'Red', 'Dune') for s in self.played + [self.upcoming]])
+        self.assertEqual(list(ArchivedPurchase.objects.order_by('id').values_list('film_session_id', 'seats')),
+                         [(s.id, [0, 1]) for s in self.played])
+        self.assertTrue(Film.objects.exists())
+
+    def test_rollups_outlive_deleted_hall_and_film(self):
+        day = timezone.localdate(self.played[0].start)
+        SalesRollup.objects.create(day=day, hour=1, film=self.film, hall=self.hall, tickets=4, revenue=400)
+        CapacityRollup.objects.create(day=day, hour=1, film=self.film, hall=self.hall, sessions=2, seats=100)
+        client = self.api_client(self.admin)
+        self.upcoming.delete()
+        self.assertEqual(client.delete('/api/hall/%s/' % self.hall.id).status_code, 204)
+        self.assertEqual(client.delete('/api/film/%s/' % self.film.id).status_code, 204)
+        self.assertEqual(list(SalesRollup.objects.values_list('tickets', 'revenue')), [(4, 400)])
+        self.assertEqual(CapacityRollup.objects.get().seats, 100)
+
+    def test_archive_keeps_bigint_ids(self):
+        start = self.now - datetime.timedelta(days=5)
+        big = FilmSession.objects.create(id=2 ** 31 + 5, film=self.film, hall=self.hall, start=start,
+                                         end=start + datetime.timedelta(hours=2), price=100, hall_size=50)
+        Purchase.objects.create(id=2 ** 31 + 7, film_session=big, user=self.user, count=1)
+        big.delete()
+        self.assertEqual(ArchivedPurchase.objects.get(film_session_id=big.id).id, 2 ** 31 + 7)
+
+    @override_settings(ARCHIVE_DELETED_SESSIONS=False)
+    def test_hard_delete(self):
+        FilmSession.objects.filter(start__lt=self.now).delete()
+        self.assertEqual(list(FilmSession.objects.values_list('id', flat=True)), [self.upcoming.id])
+        self.assertFalse(Purchase.objects.exists())
+        self.assertFalse(ArchivedFilmSession.objects.exists())
+
+
+class ArchiveTest(CinemaTestCase):
+    def setUp(self):
+        super().setUp()
+        self.old = self.make_sessions(3, start=self.now - datetime.timedelta(days=settings.ARCHIVE_AFTER_DAYS + 2))
+        self.recent = self.make_sessions(1, start=self.now - datetime.timedelta(days=1))[0]
+        for film_session in self.old + [self.recent]:
+            Purchase.objects.create(film_session=film_session, user=self.user, count=1)
+
+    def test_ended_sessions_move_to_the_archive_in_batches(self):
+        out = io.StringIO()
+        call_command('archive_sessions', batch_size=2, stdout=out)
+        self.assertEqual(out.getvalue().strip(), 'Archived 3 sessions')
+        self.assertEqual(list(FilmSession.objects.values_list('id', flat=True)), [self.recent.id])
+        self.assertEqual(list(Purchase.objects.values_list('film_session_id', flat=True)), [self.recent.id])
+
+        client = self.api_client(self.user)
+        rows = client.get('/api/archive/purchase/').data['results']
+        self.assertEqual(sorted(row['film_session']['id'] for row in rows), [s.id for s in self.old])
+        day = timezone.localdate(Purchase.objects.get().created_at).isoformat()
+        self.assertEqual(len(client.get('/api/archive/purchase/?from=%s&to=%s' % (day, day)).data['results']), 3)
+        self.assertEqual(client.get('/api/archive/purchase/?from=someday').status_code, 400)
+        other = MyUser.objects.create_user(username='other', password='secret')
+        self.assertEqual(self.api_client(other).get('/api/archive/purchase/').data['results'], [])
+
+        days = [timezone.localdate(s.start).isoformat() for s in (self.old[0], self.old[-1])]
+        rows = client.get('/api/archive/session/?from=%s&to=%s' % tuple(days)).data['results']
+        self.assertEqual([(row['id'], row['hall_name']) for row in rows], [(s.id, 'Red') for s in self.old])
+
+    def test_archived_history_keeps_counters_and_rollups(self):
+        # Each session had one ticket sold.
+        FilmSession.objects.update(hall_size=F('hall_size') - 1)
+        call_command('rebuild_user_stats', stdout=io.StringIO())
+        call_command('backfill_rollups', stdout=io.StringIO())
+        sales = list(SalesRollup.objects.order_by('day', 'hour').values_list('day', 'hour', 'tickets', 'revenue'))
+        capacity = list(CapacityRollup.objects.order_by('day', 'hour').values_list('day', 'hour', 'sessions', 'seats'))
+        call_command('archive_sessions', stdout=io.StringIO())
+        call_command('rebuild_user_stats', '--verify', stdout=io.StringIO())
+        call_command('rebuild_user_stats', stdout=io.StringIO())
+        self.user.refresh_from_db()
+        self.assertEqual((self.user.total_spent, self.user.tickets_bought), (400, 4))
+        call_command('backfill_rollups', stdout=io.StringIO())
+        self.assertEqual(list(SalesRollup.objects.order_by('day', 'hour').values_list(
+            'day', 'hour', 'tickets', 'revenue')), sales)
+        self.assertEqual(list(CapacityRollup.objects.order_by('day', 'hour').values_list(
+            'day', 'hour', 'sessions', 'seats')), capacity)
+        self.assertEqual(len(sales), 4)
+
+
+class ScheduleSnapshotTest(CinemaTestCase):
+    def setUp(self):
+        super().setUp()
+        self.tomorrow = timezone.localdate() + datetime.timedelta(days=1)
+        day_start = timezone.make_aware(datetime.datetime.combine(self.tomorrow, datetime.time.min))
+        self.sessions = [FilmSession.objects.create(film=self.film, hall=self.hall,
+                                                    start=day_start + datetime.timedelta(hours=2 * i),
+                                                    end=day_start + datetime.timedelta(hours=2 * i + 2),
+                                                    price=100 + i * 7 % 5, hall_size=50)
+                         for i in range(12)]
+        self.client.force_login(self.user)
+
+    def test_pages_come_from_one_snapshot_read(self):
+        for ordering, keyset in (('2', ('start', 'id')), ('1', ('price', 'id'))):
+            self.assertEqual(self.walk_html('/?period=3&ordering=%s' % ordering),
+                             list(FilmSession.objects.order_by(*keyset).values_list('id', flat=True)))
+        self.assertEqual(ScheduleSnapshot.objects.get().day, self.tomorrow)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/?period=3&ordering=1')
+        self.assertContains(response, 'Red')
+        listing = [q['sql'] for q in queries if 'cinapp_' in q['sql'] and 'cinapp_myuser' not in q['sql']]
+        self.assertEqual(len(listing), 1)
+        self.assertIn('cinapp_schedulesnapshot', listing[0])
+
+    def test_session_changes_rebuild_the_snapshot(self):
+        self.walk_html('/?period=3')
+        moved, deleted = self.sessions[0], self.sessions[1]
+        with self.captureOnCommitCallbacks(execute=True):
+            moved.start -= datetime.timedelta(days=1)
+            moved.end -= datetime.timedelta(days=1)
+            moved.save()
+        with self.captureOnCommitCallbacks(execute=True):
+            deleted.delete()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.hall.name = 'Green'
+            self.hall.save()
+        self.assertEqual(self.walk_html('/?period=3'), [obj.id for obj in self.sessions[2:]])
+        self.assertEqual(self.walk_html('/?period=2'), [moved.id])
+        self.assertContains(self.client.get('/?period=3'), 'Green')
+        self.assertEqual(sorted(ScheduleSnapshot.objects.values_list('day', flat=True)),
+                         [self.tomorrow - datetime.timedelta(days=1), self.tomorrow])
@@ -0,0 +1,124 @@
+import datetime
+
+from django.db import connection
+from django.utils import timezone
+from rest_framework import serializers
+from cinapp.models import Film, Hall, FilmSession, Purchase, SeatHold
+
+# Domain rules shared by the forms and the API. Each check returns (field, message)
+# pairs: forms attach them to fields, serializers raise the first one. Rules that
+# need the database are asked in a single query, and only once the cheap ones pass.
+
+MIN_FILM_LENGTH = datetime.timedelta(minutes=30, hours=1)
+MAX_FILM_LENGTH = datetime.timedelta(hours=4)
+
+SOLD_HALL_MESSAGE = 'You can not edit this hall because tickets with this one was sold'
+SOLD_SESSION_MESSAGE = 'You can not edit this session because tickets with this one was sold'
+
+
+def exists_flags(**querysets):
+    # {'name': queryset} -> {'name': bool}, all in one SELECT EXISTS(...), EXISTS(...).
+    columns, params = [], []
+    for queryset in querysets.values():
+        sql, query_params = queryset.values('pk').query.sql_with_params()
+        columns.append('EXISTS (%s)' % sql)
+        params.extend(query_params)
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT %s' % ', '.join(columns), params)
+        return dict(zip(querysets, cursor.fetchone()))
+
+
+def film_errors(name, start_premier, end_premier, length, genre):
+    errors = []
+    if length < MIN_FILM_LENGTH:
+        errors.append(('length', 'Film length must be greater than 01:30:00'))
+    if length > MAX_FILM_LENGTH:
+        errors.append(('length', 'Film length must be lower than 04:00:00'))
+    if start_premier > end_premier:
+        errors.append(('start_premier', 'Your premier date is wrong'))
+    if not errors and Film.objects.filter(name__iexact=name, start_premier=start_premier, end_premier=end_premier,
+                                          length=length, genre=genre).exists():
+        errors.append(('name', 'You already have added this film'))
+    return errors
+
+
+def hall_errors(name, size, row_size, hall=None):
+    # hall is the stored one, before the edit.
+    errors = []
+    if size <= 0:
+        errors.append(('size', 'Size of the hall must be greater than zero'))
+    if row_size <= 0:
+        errors.append(('row_size', 'Row size of the hall must be greater than zero'))
+    if errors:
+        return errors
+    checks = {'duplicate': Hall.objects.filter(name__iexact=name)}
+    if hall is not None:
+        checks['duplicate'] = checks['duplicate'].exclude(id=hall.id)
+        if size < hall.size or row_size != hall.row_size:
+            # Sold and held seats keep their numbers, so a hall with upcoming sales may only grow.
+            now = timezone.now()
+            checks['sold'] = Purchase.objects.filter(film_session__hall=hall, film_session__start__gt=now)
+            checks['held'] = SeatHold.objects.filter(film_session__hall=hall, film_session__start__gt=now)
+    flags = exists_flags(**checks)
+    if flags.get('sold') or flags.get('held'):
+        errors.append(('name', SOLD_HALL_MESSAGE))
+    if flags['duplicate']:
+        errors.append(('name', 'There already has been hall with this name'))
+    return errors
+
+
+def session_rule_errors(film, start, end, price):
+    errors = []
+    delta = end - start
+    if delta > (film.length + datetime.timedelta(minutes=20)) or delta < film.length:
+        errors.append(('film', 'Your session time is incorrect '))
+    if start >= end:
+        errors.append(('start', 'Something is wrong with your session'))
+    if start.date() < film.start_premier:
+        errors.append(('start', 'The start of session does not consist with premier'))
+    if end.date() > film.end_premier:
+        errors.append(('end', 'The end of session does not consist with premier'))
+    if price <= 0:
+        errors.append(('price', 'Enter a correct price!'))
+    return errors
+
+
+def session_errors(film, hall, start, end, price, session_id=None):
+    errors = session_rule_errors(film, start, end, price)
+    if errors and session_id is None:
+        return errors
+    overlapping = FilmSession.objects.overlapping(hall, start, end)
+    checks = {'overlap': overlapping}
+    if session_id is not None:
+        checks['overlap'] = overlapping.exclude(id=session_id)
+        checks['sold'] = Purchase.objects.filter(film_session_id=session_id)
+    flags = exists_flags(**checks)
+    if flags.get('sold'):
+        return [('film', SOLD_SESSION_MESSAGE)]
+    if not errors and flags['overlap']:
+        errors.append(('hall', FilmSession.BOOKED_MESSAGE))
+    return errors
+
+
+def purchase_errors(user, film_session, count):
+    # Works on the session the caller has already loaded; no queries.
+    errors = []
+    if film_session.start < timezone.now():
+        errors.append(('count', 'You can not buy ticket for this session because this one has already started'))
+    if count <= 0:
+        errors.append(('count', 'You should select one more tickets'))
+    elif count > film_session.hall_size:
+        errors.append(('count', 'Sorry, not enough tickets'))
+    elif count * film_session.price > user.wallet:
+        errors.append(('count', 'Not enough money'))
+    return errors
+
+
+def raise_first(errors):
+    if errors:
+        raise serializers.ValidationError(errors[0][1])
+
+
+def add_errors(form, errors):
+    for field, message in errors:
+        form.add_error(field, message)
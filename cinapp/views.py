@@ -1,15 +1,21 @@
 import datetime
 
-from django.db import transaction
-from django.db.models import Sum
 from django.contrib.auth.mixins import UserPassesTestMixin
 from django.contrib.auth.views import LoginView, LogoutView
+from django.db import transaction
+from django.http import HttpResponseRedirect
 from django.urls import reverse
+from django.utils import timezone
 from django.views.generic import ListView, CreateView, DetailView, UpdateView, TemplateView
 from django.views.generic.edit import FormMixin
 from cinapp.forms import MyUserCreationForm, AddFilmForm, FilterForm, AddPurchaseForm, \
     FilmSessionForm, HallForm
+from rest_framework import serializers
+from .caching import session_listing, listing_params
 from .models import Hall, Purchase, Film, FilmSession
+from .pagination import KeysetPaginationMixin
+from .reservations import reserve_seats, resize_hall
+from .snapshots import schedule_page
 
 
 class Login(LoginView):
@@ -73,45 +79,67 @@ class FilmSessionCreateView(UserPassesTestMixin, CreateView):
         obj = form.save(commit=False)
         hall = form.cleaned_data['hall']
         obj.hall_size = hall.size
-        obj.save()
-        return super().form_valid(form=form)
+        try:
+            obj.save()
+        except serializers.ValidationError as e:
+            form.add_error('hall', e.detail[0])
+            return self.form_invalid(form)
+        # Already saved; ModelFormMixin.form_valid would save it a second time.
+        self.object = obj
+        return HttpResponseRedirect(self.get_success_url())
 
 
-class FilmSessionListView(ListView):
+class FilmSessionListView(KeysetPaginationMixin, ListView):
     model = FilmSession
+    queryset = FilmSession.objects.select_related('film', 'hall')
     template_name = 'sessions.html'
     paginate_by = 10
     extra_context = {'form': FilmSessionForm, 'period_form': FilterForm}
 
+    def get_schedule_day(self):
+        period = self.request.GET.get('period')
+        today = timezone.localdate()
+        if period == '2':
+            return today
+        if period == '3':
+            return today + datetime.timedelta(days=1)
+
     def get_queryset(self):
         qs = super().get_queryset()
-        period = self.request.GET.get('period')
-        ordering = self.request.GET.get('ordering')
-        today = datetime.date.today()
-        tomorrow = datetime.timedelta(days=1) + today
-        if period == '1' and ordering == '1':
-            return qs.order_by('price')
-        elif period == '1' and ordering == '2':
-            return qs.order_by('start')
-        elif period == '1' and ordering is None:
-            return qs.all()
-        if period == '2' and ordering == '1':
-            return qs.filter(start__contains=today).order_by('price')
-        elif period == '2' and ordering == '2':
-            return qs.filter(start__contains=today).order_by('start')
-        elif period == '2' and ordering is None:
-            return qs.filter(start__contains=today)
-        if period == '3' and ordering == '1':
-            return qs.filter(start__contains=tomorrow).order_by('price')
-        elif period == '3' and ordering == '2':
-            return qs.filter(start__contains=tomorrow).order_by('start')
-        elif period == '3' and ordering is None:
-            return qs.filter(start__contains=tomorrow)
+        day = self.get_schedule_day()
+        if day is not None:
+            return qs.on_day(day)
         return qs.all()
 
+    def get_keyset(self):
+        if self.request.GET.get('ordering') == '1':
+            return ('price', 'id')
+        return ('start', 'id')
+
+    def get_page_rows(self, queryset, keyset, values, limit):
+        day = self.get_schedule_day()
+        if day is not None:
+            return schedule_page(day, keyset, values, limit)
+        return super().get_page_rows(queryset, keyset, values, limit)
+
+    def paginate_queryset(self, queryset, page_size):
+        if self.get_schedule_day() is not None:
+            # Today and tomorrow are one read of their schedule snapshot, no listing cache needed.
+            return super().paginate_queryset(queryset, page_size)
+
+        def build():
+            paginator, page, object_list, is_paginated = super(FilmSessionListView, self).paginate_queryset(
+                queryset, page_size)
+            return object_list, self.next_cursor
+
+        params = listing_params(self.request, ['period', 'ordering', self.cursor_kwarg])
+        object_list, self.next_cursor = session_listing.get_or_build(dict(params, view='html'), build)
+        return None, None, object_list, self.next_cursor is not None
+
 
 class FilmSessionDetailView(FormMixin, DetailView):
     model = FilmSession
+    queryset = FilmSession.objects.select_related('film', 'hall')
     template_name = 'detailSession.html'
     pk_url_kwarg = 'pk'
     form_class = AddPurchaseForm
@@ -121,7 +149,8 @@ class FilmSessionDetailView(FormMixin, DetailView):
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context['form'] = self.get_form()
+        if 'form' not in kwargs:
+            context['form'] = self.get_form()
         return context
 
     def post(self, request, *args, **kwargs):
@@ -135,34 +164,32 @@ class FilmSessionDetailView(FormMixin, DetailView):
     def get_form_kwargs(self):
         kw = super(FilmSessionDetailView, self).get_form_kwargs()
         kw['request'] = self.request
+        kw['film_session'] = self.object
         return kw
 
     def form_valid(self, form):
-        obj = form.save(commit=False)
-        obj.user = self.request.user
-        session_id = self.request.POST.get('filmSession')
-        obj.film_session = FilmSession.objects.get(id=int(session_id))
-        obj.film_session.hall_size = obj.film_session.hall_size - obj.count
-        sum_ = obj.count * obj.film_session.price
-        obj.user.wallet = obj.user.wallet - sum_
-        with transaction.atomic():
-            obj.user.save()
-            obj.film_session.save()
-            obj.save()
+        try:
+            reserve_seats(self.request.user, self.object, form.cleaned_data['count'])
+        except serializers.ValidationError as e:
+            form.add_error('count', e.detail[0])
+            return self.form_invalid(form)
         return super().form_valid(form=form)
 
 
-class PurchaseListView(UserPassesTestMixin, ListView):
+class PurchaseListView(UserPassesTestMixin, KeysetPaginationMixin, ListView):
     model = Purchase
+    queryset = Purchase.objects.select_related('film_session__film', 'film_session__hall')
     template_name = 'purchase.html'
     paginate_by = 10
+    keyset = ('-created_at', '-id')
 
     def test_func(self):
         return self.request.user.is_authenticated
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data()
-        context['total_exp'] = Purchase.objects.filter(user=self.request.user).aggregate(te=Sum('film_session__price'))
+        context['total_spent'] = self.request.user.total_spent
+        context['tickets_bought'] = self.request.user.tickets_bought
         return context
 
     def get_queryset(self):
@@ -183,10 +210,11 @@ class HallUpdateView(UserPassesTestMixin, UpdateView):
         return self.request.user.is_superuser
 
     def form_valid(self, form):
-        obj = form.save(commit=False)
-        FilmSession.objects.filter(hall__id=obj.id).update(hall_size=obj.size)
-        obj.save()
-        return super().form_valid(form=form)
+        with transaction.atomic():
+            self.object = form.save()
+            if 'size' in form.changed_data:
+                resize_hall(self.object)
+        return HttpResponseRedirect(self.get_success_url())
 
 
 class FilmSessionUpdateView(UpdateView):
@@ -199,5 +227,11 @@ class FilmSessionUpdateView(UpdateView):
         obj = form.save(commit=False)
         size = obj.hall.size
         obj.hall_size = size
-        obj.save()
-        return super().form_valid(form=form)
+        try:
+            obj.save()
+        except serializers.ValidationError as e:
+            form.add_error('hall', e.detail[0])
+            return self.form_invalid(form)
+        # Already saved; ModelFormMixin.form_valid would save it a second time.
+        self.object = obj
+        return HttpResponseRedirect(self.get_success_url())